@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from app.api import users, pushs, logs, admin
+from app.api import users, pushs, logs, admin, webhook
 
 api_router = APIRouter()
 
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(pushs.router, prefix="/pushs", tags=["pushs"])
 api_router.include_router(logs.router, prefix="/logs", tags=["logs"])
-api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
\ No newline at end of file
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(webhook.router, prefix="/telegram", tags=["telegram"])
\ No newline at end of file
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.db.session import get_db
+import csv
+import io
+from app.db.session import get_db, SessionLocal
 from app.crud import logs as logs_crud
 from app.schemas.logs import Log
 
@@ -40,4 +43,36 @@ def read_user_logs(
     db: Session = Depends(get_db)
 ):
     """获取特定用户的日志"""
-    return logs_crud.get_logs(db, user_id=user_id)
\ No newline at end of file
+    return logs_crud.get_logs(db, user_id=user_id)
+
+@router.get("/{push_id}/export")
+def export_push_logs(
+    push_id: int,
+    status: Optional[str] = None
+):
+    """以 CSV 流式导出特定推送的全部日志"""
+    columns = ["log_id", "push_id", "user_id", "status", "error_message", "message_id",
+               "sent_at", "deleted_at", "created_at"]
+
+    def generate():
+        # 流式响应期间使用独立会话，按批读取，不受分页限制
+        db = SessionLocal()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for log in logs_crud.iter_logs(db, push_id=push_id, status=status):
+                writer.writerow([getattr(log, column) for column in columns])
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=push_{push_id}_logs.csv"}
+    )
\ No newline at end of file
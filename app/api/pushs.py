@@ -1,19 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 import json
 import logging
+import uuid
 from app.db.session import get_db
 from app.crud import pushs as pushs_crud
+from app.crud import jobs as jobs_crud
+from app.crud import logs as logs_crud
+from app.crud import partitions as partitions_crud
 from app.schemas.pushs import Push, PushCreate, PushUpdate
 from app.core.security import get_current_admin
 from app.db.models import AdminUser
+from app.services.scheduler import notify_scheduler
+from app.core.id_set import IdSet
+from app.services.progress import progress_hub
+from app.services.dry_run import dry_run_push
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _decode_target_user_ids(push, include_targets: bool = False):
+    """将 JSON 字符串转换回列表；紧凑编码的大列表只在 include_targets 时解码"""
+    if isinstance(push.target_user_ids, str):
+        try:
+            push.target_user_ids = json.loads(push.target_user_ids)
+        except:
+            push.target_user_ids = []
+    elif include_targets and push.target_user_ids is None and push.target_user_set:
+        push.target_user_ids = IdSet(push.target_user_set).to_list()
+
+
+def _validate_audience(push_data: dict, db_push=None):
+    """校验受众定义，并把受众转换为可存入 JSON 列的字典
+
+    更新推送时 push_data 只包含修改的字段，未修改的字段取 db_push 中的值。
+    """
+    audience = push_data["audience"] if "audience" in push_data else getattr(db_push, "audience", None)
+    if "target_user_ids" in push_data:
+        has_targets = bool(push_data["target_user_ids"])
+    elif db_push.target_user_count is not None:
+        has_targets = db_push.target_user_count > 0
+    else:
+        has_targets = bool(json.loads(db_push.target_user_ids or "[]"))
+
+    audience_type = audience["type"] if audience else "explicit"
+    if audience_type == "explicit" and not has_targets:
+        raise HTTPException(status_code=400, detail="请指定目标用户或受众")
+    if audience_type == "active_since" and not audience.get("since"):
+        raise HTTPException(status_code=400, detail="active_since 受众需要提供 since")
+
+    if push_data.get("audience"):
+        push_data["audience"] = jsonable_encoder(push_data["audience"])
+
+
 @router.post("/", response_model=Push)
 def create_push(
         push: PushCreate,
@@ -23,15 +68,19 @@ def create_push(
     """创建新推送"""
     logger.info("接收到创建推送请求")
     push_data = push.dict()
+    _validate_audience(push_data)
 
     # 设置创建者ID
     push_data["created_by"] = current_admin.admin_id if current_admin else None
 
-    # 设置为草稿状态
-    push_data["status"] = "draft"
+    # 设置了发送时间的推送交给调度器，否则为草稿状态
+    push_data["status"] = "scheduled" if push_data.get("scheduled_time") else "draft"
 
-    logger.info(f"创建推送数据: {push_data}")
-    return pushs_crud.create_push(db, push_data)
+    logger.info(f"创建推送数据: {pushs_crud.describe_push_data(push_data)}")
+    db_push = pushs_crud.create_push(db, push_data)
+    if db_push.status == "scheduled":
+        notify_scheduler()
+    return db_push
 
 
 @router.get("/", response_model=List[Push])
@@ -43,13 +92,9 @@ def read_pushes(
 ):
     """获取推送列表"""
     pushes = pushs_crud.get_pushes(db, skip=skip, limit=limit, status=status)
-    # 将 JSON 字符串转换回列表
+    # 将 JSON 字符串转换回列表（紧凑编码的大列表不解码，只返回 target_user_count）
     for push in pushes:
-        if isinstance(push.target_user_ids, str):
-            try:
-                push.target_user_ids = json.loads(push.target_user_ids)
-            except:
-                push.target_user_ids = []
+        _decode_target_user_ids(push)
         # 确保 created_by 有值
         if push.created_by is None:
             push.created_by = 0
@@ -59,18 +104,14 @@ def read_pushes(
 @router.get("/{push_id}", response_model=Push)
 def read_push(
         push_id: int,
+        include_targets: bool = False,
         db: Session = Depends(get_db)
 ):
-    """获取特定推送"""
+    """获取特定推送，include_targets 为真时返回完整的目标用户列表"""
     db_push = pushs_crud.get_push(db, push_id)
     if db_push is None:
         raise HTTPException(status_code=404, detail="推送不存在")
-    # 将 JSON 字符串转换回列表
-    if isinstance(db_push.target_user_ids, str):
-        try:
-            db_push.target_user_ids = json.loads(db_push.target_user_ids)
-        except:
-            db_push.target_user_ids = []
+    _decode_target_user_ids(db_push, include_targets)
     return db_push
 
 
@@ -90,14 +131,17 @@ def update_push(
         raise HTTPException(status_code=400, detail="已发送或正在发送的推送不能更新")
 
     push_data = push.dict(exclude_unset=True)
+    if "audience" in push_data or "target_user_ids" in push_data:
+        _validate_audience(push_data, db_push)
+
+    # 修改发送时间时同步调整草稿/定时状态
+    if "scheduled_time" in push_data and "status" not in push_data and db_push.status in ["draft", "scheduled"]:
+        push_data["status"] = "scheduled" if push_data["scheduled_time"] else "draft"
+
     updated_push = pushs_crud.update_push(db, push_id=push_id, push_data=push_data)
+    notify_scheduler()
 
-    # 将 JSON 字符串转换回列表
-    if isinstance(updated_push.target_user_ids, str):
-        try:
-            updated_push.target_user_ids = json.loads(updated_push.target_user_ids)
-        except:
-            updated_push.target_user_ids = []
+    _decode_target_user_ids(updated_push)
 
     return updated_push
 
@@ -122,22 +166,37 @@ def delete_push(
 @router.post("/{push_id}/send", response_model=dict)
 async def send_push_message(
         push_id: int,
-        background_tasks: BackgroundTasks,
+        dry_run: bool = False,
         db: Session = Depends(get_db)
 ):
-    """发送推送消息"""
+    """发送推送消息，dry_run 为真时只模拟发送并返回预计耗时"""
     logger.info(f"接收到发送推送请求: {push_id}")
 
     db_push = pushs_crud.get_push(db, push_id)
     if db_push is None:
         raise HTTPException(status_code=404, detail="推送不存在")
 
+    # 模拟发送：不修改推送状态，不调用 Telegram，在线程池中执行避免阻塞事件循环
+    if dry_run:
+        try:
+            return await run_in_threadpool(dry_run_push, push_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     # 只有已完成的推送不能重新发送
     if db_push.status == "completed":
         raise HTTPException(status_code=400, detail="该推送已经完成发送")
 
-    # 更新推送状态为正在发送
-    pushs_crud.update_push_status(db, push_id=push_id, status="sending")
+    # 原子地领取推送并生成所有者令牌；重复点击或并发请求只有一个能领取成功，
+    # 其余请求返回正在进行的发送任务；加入队列失败时恢复领取前的状态
+    previous_status = db_push.status
+    token = uuid.uuid4().hex
+    if not pushs_crud.claim_push(db, push_id, token):
+        db.refresh(db_push)
+        if db_push.status != "sending":
+            raise HTTPException(status_code=400, detail="该推送已经完成发送")
+        job = jobs_crud.get_latest_job(db, push_id, kind="send")
+        return {"message": "推送正在发送中", "job_id": job.job_id if job else None}
 
     # 打印推送信息用于调试
     logger.info(f"推送ID: {push_id}, 标题: {db_push.title}")
@@ -145,15 +204,16 @@ async def send_push_message(
     logger.info(f"使用Markdown: {getattr(db_push, 'use_markdown', False)}")
     logger.info(f"按钮数据: {getattr(db_push, 'buttons', 'None')}")
 
-    # 使用后台任务发送
+    # 写入持久化任务队列，由 worker 进程领取发送
     try:
-        from app.services.push_service import send_push
-        background_tasks.add_task(send_push, push_id)
-        logger.info(f"已添加推送任务到后台: {push_id}")
-        return {"message": "推送任务已添加到队列，正在后台发送"}
+        job = jobs_crud.enqueue_job(db, push_id, kind="send", token=token)
+        logger.info(f"已添加推送任务到队列: {push_id}, 任务ID: {job.job_id}")
+        return {"message": "推送任务已添加到队列，正在后台发送", "job_id": job.job_id}
     except Exception as e:
         logger.error(f"添加推送任务失败: {e}")
-        pushs_crud.update_push_status(db, push_id=push_id, status="draft")  # 重置状态
+        # 恢复领取前的状态，定时推送重新交给调度器
+        if pushs_crud.release_push(db, push_id, token, previous_status) and previous_status == "scheduled":
+            notify_scheduler()
         raise HTTPException(status_code=500, detail=f"发送失败: {str(e)}")
 
 
@@ -173,33 +233,102 @@ def cancel_push(
 
     updated_push = pushs_crud.update_push_status(db, push_id=push_id, status="cancelled")
 
-    # 将 JSON 字符串转换回列表
-    if isinstance(updated_push.target_user_ids, str):
-        try:
-            updated_push.target_user_ids = json.loads(updated_push.target_user_ids)
-        except:
-            updated_push.target_user_ids = []
+    _decode_target_user_ids(updated_push)
 
     return updated_push
 
 
 @router.delete("/{push_id}/message", response_model=dict)
-async def delete_push_message(
+def delete_push_message(
         push_id: int,
         db: Session = Depends(get_db)
 ):
-    """删除已发送的推送消息"""
+    """删除已发送的推送消息（后台任务）"""
     logger.info(f"接收到删除推送消息请求: {push_id}")
 
     db_push = pushs_crud.get_push(db, push_id)
     if db_push is None:
         raise HTTPException(status_code=404, detail="推送不存在")
 
+    # 已有未完成的删除任务时直接返回，避免重复删除
+    job = jobs_crud.get_latest_job(db, push_id, kind="delete")
+    if job and job.status in ["pending", "running"]:
+        return {"message": "删除任务正在执行", "job_id": job.job_id}
+
     try:
-        # 导入推送服务
-        from app.services.push_service import delete_sent_message
-        result = await delete_sent_message(push_id)
-        return {"message": "消息删除成功", "details": result}
+        job = jobs_crud.enqueue_job(db, push_id, kind="delete")
+        logger.info(f"已添加删除任务到队列: {push_id}, 任务ID: {job.job_id}")
+        return {"message": "删除任务已添加到队列，正在后台删除", "job_id": job.job_id}
     except Exception as e:
-        logger.error(f"删除消息失败: {e}")
-        raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
\ No newline at end of file
+        logger.error(f"添加删除任务失败: {e}")
+        raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
+
+
+@router.get("/{push_id}/message/progress", response_model=dict)
+def read_delete_progress(
+        push_id: int,
+        db: Session = Depends(get_db)
+):
+    """获取删除已发送消息的进度"""
+    db_push = pushs_crud.get_push(db, push_id)
+    if db_push is None:
+        raise HTTPException(status_code=404, detail="推送不存在")
+
+    total, deleted = logs_crud.get_deletion_progress(db, push_id)
+    job = jobs_crud.get_latest_job(db, push_id, kind="delete")
+    return {
+        "push_id": push_id,
+        "job_id": job.job_id if job else None,
+        "status": job.status if job else None,
+        "total_count": total,
+        "deleted_count": deleted,
+        "remaining_count": total - deleted,
+        "error": job.error_message if job else None
+    }
+
+
+@router.get("/{push_id}/progress/stream")
+async def stream_push_progress(push_id: int):
+    """以 Server-Sent Events 推送发送进度（sent/failed/throttled/ETA），推送结束后关闭
+
+    在本进程中发送的推送直接读取发送协程的内存计数，不查询数据库。
+    """
+    async def generate():
+        async for snapshot in progress_hub.subscribe(push_id):
+            if snapshot is None:
+                yield "event: error\ndata: {\"detail\": \"推送不存在\"}\n\n"
+                return
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/{push_id}/partitions", response_model=List[dict])
+def read_push_partitions(
+        push_id: int,
+        db: Session = Depends(get_db)
+):
+    """获取分片发送推送的分区进度"""
+    db_push = pushs_crud.get_push(db, push_id)
+    if db_push is None:
+        raise HTTPException(status_code=404, detail="推送不存在")
+
+    return [
+        {
+            "partition_no": partition.partition_no,
+            "lo_user_id": partition.lo_user_id,
+            "hi_user_id": partition.hi_user_id,
+            "status": partition.status,
+            "worker_id": partition.worker_id,
+            "lease_expires_at": partition.lease_expires_at,
+            "attempts": partition.attempts,
+            "sent_count": partition.sent_count,
+            "failed_count": partition.failed_count,
+            "error": partition.error_message
+        }
+        for partition in partitions_crud.get_partitions(db, push_id)
+    ]
\ No newline at end of file
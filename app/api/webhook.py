@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Header, HTTPException, Request
+from typing import Optional
+import hmac
+import logging
+from app.bot.bot import get_application, webhook_secret, process_webhook_update
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.post("/webhook/{bot_index}")
+async def receive_update(
+        bot_index: int,
+        request: Request,
+        x_telegram_bot_api_secret_token: Optional[str] = Header(None)
+):
+    """接收 Telegram 推送的更新（webhook 模式）
+
+    校验请求头中的密钥后把更新交给对应 Bot 的应用在后台处理，立即返回，
+    Telegram 可以并发投递更新，多个 API 进程都可以处理。
+    """
+    if get_application(bot_index) is None:
+        raise HTTPException(status_code=404, detail="Bot 不存在")
+    if not x_telegram_bot_api_secret_token or not hmac.compare_digest(
+            x_telegram_bot_api_secret_token, webhook_secret(bot_index)):
+        logger.warning(f"Bot {bot_index} 收到密钥无效的 webhook 请求")
+        raise HTTPException(status_code=403, detail="密钥无效")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的更新数据")
+    await process_webhook_update(bot_index, data)
+    return {"ok": True}
\ No newline at end of file
@@ -1,15 +1,17 @@
+import hashlib
 import logging
-from telegram import Update, Bot
+from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram.error import TelegramError
-import httpx
 import asyncio
-from app.bot.config import BOT_TOKEN, REQUEST_KWARGS
+from app.bot.client import get_bot, get_bots
+from app.bot.config import (
+    BOT_TOKENS, USE_WEBHOOK, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_SECRET, TELEGRAM_WEBHOOK_MAX_CONNECTIONS
+)
 from app.db.session import get_db
 from app.crud.users import create_user, get_user_by_telegram_id
 from sqlalchemy.orm import Session
 from datetime import datetime
-from app.core.proxy import PROXIES, USE_PROXY
 
 # 配置日志
 logging.basicConfig(
@@ -18,11 +20,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# webhook 路由的路径，完整地址为 {TELEGRAM_WEBHOOK_URL}{WEBHOOK_PATH}/{Bot序号}
+WEBHOOK_PATH = "/api/telegram/webhook"
+
+# Bot 序号 -> 应用实例
+_applications = {}
+
 
 # 命令处理器
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """处理 /start 命令，注册用户"""
+    """处理 /start 命令，注册用户
+
+    用户固定分配给收到命令的 Bot，之后的推送都由该 Bot 发送（用户只能收到自己启动过的 Bot 的消息）。
+    """
     telegram_user = update.effective_user
+    bot_index = context.bot_data.get("bot_index", 0)
     db = next(get_db())
 
     try:
@@ -37,13 +49,25 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "first_name": telegram_user.first_name,
                 "last_name": telegram_user.last_name,
                 "is_active": True,
-                "last_interaction_at": datetime.now()
+                "last_interaction_at": datetime.now(),
+                "bot_index": bot_index
             }
             create_user(db, new_user)
             await update.message.reply_text(
                 f"欢迎使用消息推送机器人，{telegram_user.first_name}！\n"
                 f"您已成功注册，将会收到管理员发送的消息。"
             )
+        elif not user.is_active:
+            # 之前退订或屏蔽过 Bot 的用户重新订阅，改由本次收到命令的 Bot 发送
+            user.is_active = True
+            user.bot_index = bot_index
+            user.last_interaction_at = datetime.now()
+            db.commit()
+
+            await update.message.reply_text(
+                f"欢迎回来，{telegram_user.first_name}！\n"
+                f"您已重新订阅，将会继续收到管理员发送的消息。"
+            )
         else:
             # 更新用户的最后交互时间
             user.last_interaction_at = datetime.now()
@@ -61,46 +85,126 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         db.rollback()
 
 
-# 初始化 Bot
-def setup_bot():
-    """设置并返回 Telegram Bot 应用实例"""
+async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """处理 /stop 命令，退订推送"""
+    telegram_user = update.effective_user
+    db = next(get_db())
+
     try:
-        # 配置代理
-        proxy_url = None
-        if USE_PROXY:
-            proxy_url = PROXIES.get("https://")
+        user = get_user_by_telegram_id(db, telegram_user.id)
+        if user and user.is_active:
+            user.is_active = False
+            user.last_interaction_at = datetime.now()
+            db.commit()
 
-        # 创建应用实例
-        application_builder = Application.builder().token(BOT_TOKEN)
+        await update.message.reply_text(
+            "您已退订，将不会再收到推送消息。\n"
+            "如需重新订阅，请发送 /start。"
+        )
+    except Exception as e:
+        logger.error(f"Error in stop command: {e}")
+        await update.message.reply_text(
+            "抱歉，发生了错误。请稍后再试。"
+        )
+        db.rollback()
 
-        # 如果有代理，配置代理
-        if proxy_url:
-            application_builder.proxy_url(proxy_url)
 
-        application = application_builder.build()
+# 初始化 Bot
+def setup_bot(bot_index: int = 0):
+    """设置并返回 Bot 池中第 bot_index 个 Bot 的应用实例"""
+    try:
+        # 创建应用实例，复用进程内共享的 Bot（代理和连接池在 app.bot.client 中配置）
+        builder = Application.builder().bot(get_bot(bot_index))
+        if USE_WEBHOOK:
+            # webhook 模式下更新由 API 路由接收，不需要长轮询的 Updater
+            builder = builder.updater(None)
+        application = builder.build()
+        application.bot_data["bot_index"] = bot_index
 
         # 注册命令处理器
         application.add_handler(CommandHandler("start", start_command))
+        application.add_handler(CommandHandler("stop", stop_command))
 
+        _applications[bot_index] = application
         return application
     except Exception as e:
         logger.error(f"Error setting up bot: {e}")
         return None
 
 
+def setup_bots():
+    """为 Bot 池中的每个 Bot 设置应用实例，返回设置成功的应用列表"""
+    applications = [setup_bot(index) for index in range(len(get_bots()))]
+    return [application for application in applications if application]
+
+
+def get_application(bot_index: int):
+    """获取已设置的第 bot_index 个 Bot 的应用实例，不存在时返回 None"""
+    return _applications.get(bot_index)
+
+
+def webhook_secret(bot_index: int) -> str:
+    """第 bot_index 个 Bot 的 webhook 密钥
+
+    未配置 TELEGRAM_WEBHOOK_SECRET 时由 Bot Token 派生，多个 API 进程得到相同的密钥。
+    """
+    if TELEGRAM_WEBHOOK_SECRET:
+        return TELEGRAM_WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{BOT_TOKENS[bot_index]}".encode()).hexdigest()
+
+
+async def start_bot(application):
+    """启动 Bot 应用：webhook 模式下向 Telegram 注册 webhook，否则开始长轮询"""
+    await application.initialize()
+    await application.start()
+    if USE_WEBHOOK:
+        bot_index = application.bot_data["bot_index"]
+        await application.bot.set_webhook(
+            url=f"{TELEGRAM_WEBHOOK_URL}{WEBHOOK_PATH}/{bot_index}",
+            secret_token=webhook_secret(bot_index),
+            max_connections=TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"Bot {bot_index} 已注册 webhook")
+    else:
+        # 开始长轮询时会删除之前注册的 webhook
+        await application.updater.start_polling()
+
+
+async def stop_bot(application):
+    """停止 Bot 应用，等待正在处理的更新完成
+
+    webhook 模式下不删除 webhook，其他 API 进程可以继续接收更新。
+    """
+    if application.updater and application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+
+async def process_webhook_update(bot_index: int, data: dict) -> bool:
+    """处理 webhook 收到的更新，Bot 不存在时返回 False
+
+    更新在后台任务中并发处理，调用方可以立即响应 Telegram；
+    处理出错时交给应用的错误处理器，停止应用时会等待这些任务结束。
+    """
+    application = get_application(bot_index)
+    if application is None:
+        return False
+    update = Update.de_json(data, application.bot)
+    application.create_task(application.process_update(update), update=update)
+    return True
+
+
 # 运行 Bot
 async def run_bot():
     """启动 Bot 并保持运行"""
     application = setup_bot()
     if application:
-        await application.initialize()
-        await application.start()
-        await application.updater.start_polling()
+        await start_bot(application)
 
         # 保持 Bot 运行
         try:
-            await application.updater.stop()
-            await application.stop()
+            await stop_bot(application)
         except Exception as e:
             logger.error(f"Error stopping bot: {e}")
     else:
@@ -109,18 +213,15 @@ async def run_bot():
 
 # 发送消息功能
 async def send_message(chat_id, text, parse_mode=None, **kwargs):
-    """通过代理发送消息"""
+    """通过共享的 Bot 客户端发送消息"""
     try:
-        # 使用 httpx 创建代理客户端
-        async with httpx.AsyncClient(proxies=REQUEST_KWARGS.get('proxy_url')) as client:
-            bot = Bot(token=BOT_TOKEN)
-            await bot.initialize()
-            await bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
-                **kwargs
-            )
+        # 使用共享的 Bot 连接池发送
+        await get_bot().send_message(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=parse_mode,
+            **kwargs
+        )
     except TelegramError as e:
         logger.error(f"Telegram error when sending message: {e}")
         raise
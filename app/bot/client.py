@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from telegram import Bot
+from telegram.request import HTTPXRequest
+from app.bot.config import (
+    BOT_TOKENS, TELEGRAM_API_BASE_URL, TELEGRAM_POOL_SIZE, TELEGRAM_POOL_TIMEOUT, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT
+)
+from app.core.proxy import PROXIES, USE_PROXY
+
+logger = logging.getLogger(__name__)
+
+_bots = None
+
+
+def _build_request(pool_size: int) -> HTTPXRequest:
+    """创建带连接池和 keep-alive 的请求对象，按需使用代理"""
+    proxy_url = PROXIES.get("https://") if USE_PROXY else None
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        proxy_url=proxy_url,
+        pool_timeout=TELEGRAM_POOL_TIMEOUT,
+        connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=TELEGRAM_READ_TIMEOUT,
+    )
+
+
+def get_bots() -> list:
+    """获取进程内共享的 Bot 池，序号与 BOT_TOKENS 一致
+
+    每个 Bot 有独立的连接池，所有发送、删除和轮询都复用它，避免每次调用重新建立连接和 TLS 握手。
+    """
+    global _bots
+    if _bots is None:
+        _bots = [
+            Bot(
+                token=token,
+                base_url=TELEGRAM_API_BASE_URL,
+                request=_build_request(TELEGRAM_POOL_SIZE),
+                # 长轮询单独使用一个连接，不占用发送连接池
+                get_updates_request=_build_request(1),
+            )
+            for token in BOT_TOKENS
+        ]
+        logger.info(f"创建共享 Bot 客户端 {len(_bots)} 个，每个连接池大小: {TELEGRAM_POOL_SIZE}")
+    return _bots
+
+
+def get_bot(index: int = 0) -> Bot:
+    """获取 Bot 池中第 index 个 Bot，序号不在 Bot 池中时返回第一个"""
+    bots = get_bots()
+    if index is None or not 0 <= index < len(bots):
+        index = 0
+    return bots[index]
+
+
+async def init_bot():
+    """初始化共享的 Bot 池（建立连接池）"""
+    await asyncio.gather(*(bot.initialize() for bot in get_bots()))
+
+
+async def shutdown_bot():
+    """关闭共享 Bot 池的连接池"""
+    global _bots
+    if _bots is not None:
+        await asyncio.gather(*(bot.shutdown() for bot in _bots), return_exceptions=True)
+        _bots = None
\ No newline at end of file
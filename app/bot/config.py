@@ -5,6 +5,23 @@ load_dotenv()
 
 # Bot 配置
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Bot 池：额外的 Bot Token，逗号分隔。每个 Bot 有独立的连接池和限流器，推送时并行发送，
+# 用户固定由 /start 时收到命令的 Bot 发送。用户按序号记录所属 Bot（TELEGRAM_BOT_TOKEN 为 0），
+# 因此只能在末尾追加新 Token，不能删除或调整顺序
+BOT_TOKENS = [BOT_TOKEN] + [
+    token.strip() for token in os.getenv("TELEGRAM_EXTRA_BOT_TOKENS", "").split(",") if token.strip()
+]
+# Bot API 地址，可指向自建的 Bot API 服务器或性能测试用的模拟服务器
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+# Webhook 模式：设置公网 HTTPS 地址后，Telegram 把更新推送到
+# {TELEGRAM_WEBHOOK_URL}/api/telegram/webhook/{Bot序号}，不再长轮询，任意 API 进程都可以处理更新
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").rstrip("/")
+USE_WEBHOOK = bool(TELEGRAM_WEBHOOK_URL)
+# 校验请求头 X-Telegram-Bot-Api-Secret-Token 的密钥，未设置时由各个 Bot 的 Token 派生
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# Telegram 同时向 webhook 发起的最大连接数（1-100）
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
 
 # 代理配置
 PROXY_URL = os.getenv("HTTP_PROXY")
@@ -15,4 +32,60 @@ USE_PROXY = bool(PROXY_URL)
 # 其他配置
 REQUEST_KWARGS = {
     'proxy_url': PROXY_URL if USE_PROXY else None,
-}
\ No newline at end of file
+}
+
+# 推送发送配置
+# 同时发送消息的协程数量
+PUSH_CONCURRENCY = int(os.getenv("PUSH_CONCURRENCY", "30"))
+# 全局每秒发送上限（Telegram 约为 30 条/秒）
+PUSH_GLOBAL_RATE = float(os.getenv("PUSH_GLOBAL_RATE", "30"))
+# 全局令牌桶容量，保持较小可以避免瞬时突发超过限制
+PUSH_GLOBAL_BURST = float(os.getenv("PUSH_GLOBAL_BURST", "1"))
+# 同一聊天每秒发送上限（Telegram 约为 1 条/秒）
+PUSH_PER_CHAT_RATE = float(os.getenv("PUSH_PER_CHAT_RATE", "1"))
+# 自适应限流：触发限流或延迟过高时降速，最低不低于该值（条/秒）
+PUSH_MIN_RATE = float(os.getenv("PUSH_MIN_RATE", "3"))
+# 平均发送延迟（秒）超过该值时降低发送速率
+PUSH_LATENCY_TARGET = float(os.getenv("PUSH_LATENCY_TARGET", "2"))
+# 限流和临时网络错误的最大重试次数
+PUSH_MAX_RETRIES = int(os.getenv("PUSH_MAX_RETRIES", "5"))
+# 推送优先级（从高到低）及其分享全局发送速率的权重，格式为 "优先级:权重,..."
+# 同时发送的推送按权重分配全局配额，如默认配置下紧急推送与大批量推送同时发送时获得 32/33 的速率
+PUSH_PRIORITIES = ("urgent", "normal", "bulk")
+PUSH_PRIORITY_WEIGHTS = {
+    name: float(weight)
+    for name, weight in (
+        item.split(":") for item in os.getenv("PUSH_PRIORITY_WEIGHTS", "urgent:32,normal:4,bulk:1").split(",")
+    )
+}
+# 日志缓冲写入：达到条数或时间间隔（秒）时批量写入数据库
+LOG_FLUSH_SIZE = int(os.getenv("LOG_FLUSH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))
+# 推送计数批量更新间隔（秒）
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "1"))
+
+# Telegram HTTP 连接池配置
+# 连接池大小，应不小于发送并发数
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", str(PUSH_CONCURRENCY + 10)))
+# 等待空闲连接的超时时间（秒）
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "10"))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "10"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "30"))
+
+# 定时推送调度配置
+# 调度器每次加载未来多少秒内到期的推送；没有新事件时也按该间隔重新加载
+SCHEDULER_HORIZON = float(os.getenv("SCHEDULER_HORIZON", "300"))
+
+# 分片发送配置：目标用户超过该数量的推送按用户ID切分为多个分区，由多个 worker 并行发送
+PUSH_PARTITION_SIZE = int(os.getenv("PUSH_PARTITION_SIZE", "20000"))
+# 分区租约时长（秒），持有者崩溃后租约到期即可被其他 worker 接管
+PARTITION_LEASE_SECONDS = int(os.getenv("PARTITION_LEASE_SECONDS", "60"))
+
+# 指定用户超过该数量时以紧凑的二进制格式存储，接口默认不返回完整列表
+TARGET_IDS_COMPACT_THRESHOLD = int(os.getenv("TARGET_IDS_COMPACT_THRESHOLD", "1000"))
+
+# 推送进度推送配置
+# 每个订阅者两次进度更新之间的最小间隔（秒）
+PROGRESS_STREAM_INTERVAL = float(os.getenv("PROGRESS_STREAM_INTERVAL", "1"))
+# 推送在其他进程中发送时，从数据库读取进度的间隔（秒）
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "5"))
\ No newline at end of file
@@ -0,0 +1,104 @@
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, islice
+
+# 格式：头部 (魔数, 数量, 块数) + 块索引 [(首个ID, 偏移, 数量, 类型码), ...] + 各块数据
+# 每块存放排序后相邻ID的差值数组，按最大差值选用 H/I/Q 定宽类型后单独 zlib 压缩，
+# 解码时用 array.frombytes + accumulate 在 C 层还原，不需要逐字节解析。
+MAGIC = b"IDS1"
+BLOCK_SIZE = 4096
+_HEADER = struct.Struct("<4sII")
+_BLOCK = struct.Struct("<qIIc")
+
+
+class IdSet:
+    """紧凑存储的有序用户ID集合
+
+    支持读取数量、二分查找成员、按范围分批迭代，不需要解码成完整的 Python 列表。
+    """
+
+    def __init__(self, data: bytes):
+        magic, self._count, block_count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("无效的用户ID集合数据")
+        self._data = data
+        self._blocks = [
+            _BLOCK.unpack_from(data, _HEADER.size + i * _BLOCK.size) for i in range(block_count)
+        ]
+        self._firsts = [block[0] for block in self._blocks]
+        self._payload_start = _HEADER.size + block_count * _BLOCK.size
+        self._cached = (None, None)
+
+    @staticmethod
+    def encode(user_ids) -> bytes:
+        """把用户ID编码为紧凑的二进制数据（自动去重排序）"""
+        ids = sorted(set(user_ids))
+        index = []
+        payload = []
+        offset = 0
+        for start in range(0, len(ids), BLOCK_SIZE):
+            block = ids[start:start + BLOCK_SIZE]
+            deltas = [b - a for a, b in zip(block, block[1:])]
+            largest = max(deltas, default=0)
+            typecode = "H" if largest < 1 << 16 else "I" if largest < 1 << 32 else "Q"
+            compressed = zlib.compress(array(typecode, deltas).tobytes())
+            index.append(_BLOCK.pack(block[0], offset, len(block), typecode.encode()))
+            payload.append(compressed)
+            offset += len(compressed)
+        return _HEADER.pack(MAGIC, len(ids), len(index)) + b"".join(index) + b"".join(payload)
+
+    @classmethod
+    def from_ids(cls, user_ids) -> "IdSet":
+        return cls(cls.encode(user_ids))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _block(self, i: int):
+        """解码第 i 块，返回有序ID数组（缓存最近一块，便于连续查找）"""
+        if self._cached[0] == i:
+            return self._cached[1]
+        first, offset, count, typecode = self._blocks[i]
+        end = self._blocks[i + 1][1] if i + 1 < len(self._blocks) else len(self._data) - self._payload_start
+        deltas = array(typecode.decode())
+        deltas.frombytes(zlib.decompress(self._data[self._payload_start + offset:self._payload_start + end]))
+        ids = array("q", accumulate(deltas, initial=first))
+        self._cached = (i, ids)
+        return ids
+
+    def __contains__(self, user_id) -> bool:
+        i = bisect_right(self._firsts, user_id) - 1
+        if i < 0:
+            return False
+        ids = self._block(i)
+        j = bisect_left(ids, user_id)
+        return j < len(ids) and ids[j] == user_id
+
+    def iter_range(self, lo: int = None, hi: int = None):
+        """按顺序逐块返回 [lo, hi) 范围内的ID"""
+        start = 0 if lo is None else max(bisect_right(self._firsts, lo) - 1, 0)
+        for i in range(start, len(self._blocks)):
+            if hi is not None and self._firsts[i] >= hi:
+                return
+            ids = self._block(i)
+            left = 0 if lo is None else bisect_left(ids, lo)
+            right = len(ids) if hi is None else bisect_left(ids, hi)
+            yield from islice(ids, left, right)
+
+    def __iter__(self):
+        return self.iter_range()
+
+    def chunks(self, size: int, lo: int = None, hi: int = None):
+        """按 size 个一批返回 [lo, hi) 范围内的ID列表"""
+        iterator = self.iter_range(lo, hi)
+        while True:
+            chunk = list(islice(iterator, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def to_list(self):
+        """解码为完整的列表"""
+        return list(self)
\ No newline at end of file
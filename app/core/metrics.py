@@ -0,0 +1,236 @@
+"""进程内指标，以 Prometheus 文本格式导出
+
+指标只在事件循环线程中更新，每次记录只是一次字典查找和整数加法，不加锁，
+不会拖慢被测量的发送循环。队列深度等瞬时值在抓取时通过回调读取。
+"""
+import asyncio
+import logging
+import math
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self._samples()
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self):
+        for label_values, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """瞬时值，可以直接设置，也可以在抓取时由回调函数返回 {标签值元组: 数值}"""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels=(), function=None):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+        self._function = function
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def _samples(self):
+        values = dict(self._values)
+        if self._function is not None:
+            try:
+                values.update(self._function())
+            except Exception as e:
+                logger.error(f"读取指标 {self.name} 失败: {e}")
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """分桶直方图，记录时只累加所在分桶，导出时再计算累计值"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # [各分桶计数..., 总和, 次数]
+            series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _samples(self):
+        for label_values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(series[-2])}"
+            yield f"{self.name}_count{labels} {series[-1]}"
+
+
+def render() -> str:
+    """导出所有指标"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _route_label(scope) -> str:
+    """请求匹配到的完整路径模板
+
+    路由的 path_format 只相对于它所在的路由表（include_router 的前缀、子应用的挂载路径都不在其中），
+    因此从请求路径中找出路由匹配的那段后缀，前面的部分即为前缀，再拼上 path_format。
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    path_regex = getattr(route, "path_regex", None)
+    if path_format is None or path_regex is None:
+        return "unmatched"
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    # 从最短的后缀开始尝试，避免 {x:path} 之类的参数把前缀也吞进去
+    start = path.rfind("/")
+    while start >= 0:
+        if path_regex.match(path[start:]):
+            return root_path + path[:start] + path_format
+        start = path.rfind("/", 0, start)
+    return root_path + path_format
+
+
+class MetricsMiddleware:
+    """记录每个路由的请求耗时（到响应头发出为止，流式响应不计入传输时间）
+
+    路由使用完整路径模板（挂载前缀 + 路由的 path_format，如 /api/pushs/{push_id}），
+    未匹配的请求记为 unmatched，避免标签数量膨胀。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        recorded = False
+
+        def record(status):
+            nonlocal recorded
+            recorded = True
+            route = _route_label(scope)
+            HTTP_LATENCY.observe(time.monotonic() - started, scope["method"], route, str(status))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record(500)
+
+
+async def serve_metrics(port: int, host: str = "0.0.0.0"):
+    """启动最简单的 HTTP 服务导出指标，供没有 API 的独立 worker 进程使用"""
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"指标服务已启动: {host}:{port}")
+    return server
+
+
+# 发送链路
+SEND_LATENCY = Histogram(
+    "push_send_duration_seconds", "单条消息调用 Telegram 的耗时", ["content_type"]
+)
+SENDS = Counter("push_sends_total", "发送成功的消息数", ["content_type"])
+SEND_FAILURES = Counter("push_send_failures_total", "最终发送失败的消息数", ["content_type", "error"])
+FANOUT_ERRORS = Counter("fanout_errors_total", "扇出任务的每次出错（含之后重试成功的）", ["fanout", "error"])
+RETRY_AFTER = Counter("telegram_retry_after_total", "收到 Telegram 限流（429 RetryAfter）的次数", ["fanout"])
+RETRY_AFTER_SECONDS = Counter("telegram_retry_after_seconds_total", "Telegram 要求等待的总秒数", ["fanout"])
+
+# 数据库批量写入
+DB_FLUSH_LATENCY = Histogram("db_flush_duration_seconds", "缓冲数据批量写入数据库的耗时", ["kind"])
+DB_FLUSH_ROWS = Counter("db_flush_rows_total", "批量写入数据库的行数", ["kind"])
+
+# API
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "API 请求耗时", ["method", "route", "status"]
+)
\ No newline at end of file
@@ -1,5 +1,4 @@
 import os
-import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,10 +17,3 @@ if USE_PROXY:
         "http://": HTTP_PROXY,
         "https://": HTTPS_PROXY,
     }
-
-# 创建代理客户端
-def get_proxy_client():
-    """获取配置了代理的 httpx 客户端"""
-    if USE_PROXY:
-        return httpx.AsyncClient(proxies=PROXIES)
-    return httpx.AsyncClient()
\ No newline at end of file
@@ -0,0 +1,148 @@
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+from app.db.models import Push, PushJob
+from app.crud.pushs import priority_rank
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_job(db: Session, push_id: int, kind: str = "send", token: str = None):
+    """添加推送任务到队列，token 为领取推送时生成的所有者令牌"""
+    try:
+        db_job = PushJob(push_id=push_id, kind=kind, token=token, status="pending")
+        db.add(db_job)
+        db.commit()
+        db.refresh(db_job)
+        return db_job
+    except Exception as e:
+        logger.error(f"添加推送任务失败: {e}")
+        db.rollback()
+        raise
+
+
+def get_job(db: Session, job_id: int):
+    """获取特定任务"""
+    return db.query(PushJob).filter(PushJob.job_id == job_id).first()
+
+
+def get_latest_job(db: Session, push_id: int, kind: str):
+    """获取推送最近一次指定类型的任务"""
+    return (
+        db.query(PushJob)
+        .filter(PushJob.push_id == push_id, PushJob.kind == kind)
+        .order_by(PushJob.job_id.desc())
+        .first()
+    )
+
+
+def claim_job(db: Session, worker_id: str, stale_after: int, max_attempts: int, priorities=None):
+    """领取一个任务
+
+    领取等待中的任务，或心跳超过 stale_after 秒的运行中任务（原 worker 已崩溃）。
+    按推送优先级从高到低、同一优先级内先到先得；priorities 不为空时只领取这些优先级的推送的任务。
+    使用 SELECT ... FOR UPDATE SKIP LOCKED，多个 worker 同时领取不会拿到同一任务。
+    """
+    stale_before = datetime.now() - timedelta(seconds=stale_after)
+    try:
+        query = (
+            db.query(PushJob)
+            .join(Push, Push.push_id == PushJob.push_id)
+            .filter(
+                or_(
+                    PushJob.status == "pending",
+                    and_(PushJob.status == "running", PushJob.heartbeat_at < stale_before),
+                ),
+                PushJob.attempts < max_attempts,
+            )
+        )
+        if priorities:
+            query = query.filter(Push.priority.in_(priorities))
+        db_job = (
+            query
+            .order_by(priority_rank(), PushJob.job_id)
+            .with_for_update(skip_locked=True, of=PushJob)
+            .first()
+        )
+        if db_job is None:
+            db.commit()
+            return None
+
+        db_job.status = "running"
+        db_job.worker_id = worker_id
+        db_job.heartbeat_at = datetime.now()
+        db_job.attempts += 1
+        db.commit()
+        db.refresh(db_job)
+        return db_job
+    except Exception as e:
+        logger.error(f"领取任务失败: {e}")
+        db.rollback()
+        raise
+
+
+def heartbeat_job(db: Session, job_id: int, worker_id: str):
+    """更新任务心跳，返回 False 表示任务已被其他 worker 接管"""
+    try:
+        updated = (
+            db.query(PushJob)
+            .filter(PushJob.job_id == job_id, PushJob.worker_id == worker_id, PushJob.status == "running")
+            .update({PushJob.heartbeat_at: datetime.now()}, synchronize_session=False)
+        )
+        db.commit()
+        return updated > 0
+    except Exception as e:
+        logger.error(f"更新任务心跳失败: {e}")
+        db.rollback()
+        return True
+
+
+def finish_job(db: Session, job_id: int, worker_id: str, status: str, error_message: str = None):
+    """结束任务，status 为 done、failed 或 pending（释放回队列）
+
+    worker 退出时释放回队列的任务没有执行失败，退还本次领取占用的重试次数，
+    多次重新部署不会把长时间运行的任务的重试次数耗尽。
+    """
+    values = {PushJob.status: status, PushJob.error_message: error_message}
+    if status == "pending":
+        values[PushJob.worker_id] = None
+        values[PushJob.heartbeat_at] = None
+        values[PushJob.attempts] = PushJob.attempts - 1
+    try:
+        db.query(PushJob).filter(PushJob.job_id == job_id, PushJob.worker_id == worker_id).update(
+            values, synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        logger.error(f"更新任务状态失败: {e}")
+        db.rollback()
+
+
+def fail_exhausted_jobs(db: Session, stale_after: int, max_attempts: int):
+    """把重试次数用尽、不会再被领取的任务（等待中或已失去心跳）标记为失败，返回这些任务的 (push_id, kind, token)"""
+    stale_before = datetime.now() - timedelta(seconds=stale_after)
+    try:
+        rows = (
+            db.query(PushJob.job_id, PushJob.push_id, PushJob.kind, PushJob.token)
+            .filter(
+                or_(
+                    PushJob.status == "pending",
+                    and_(PushJob.status == "running", PushJob.heartbeat_at < stale_before),
+                ),
+                PushJob.attempts >= max_attempts,
+            )
+            .all()
+        )
+        if not rows:
+            return []
+        db.query(PushJob).filter(PushJob.job_id.in_([row.job_id for row in rows])).update(
+            {PushJob.status: "failed", PushJob.error_message: "超过最大重试次数"},
+            synchronize_session=False,
+        )
+        db.commit()
+        return [(row.push_id, row.kind, row.token) for row in rows]
+    except Exception as e:
+        logger.error(f"标记失败任务出错: {e}")
+        db.rollback()
+        return []
\ No newline at end of file
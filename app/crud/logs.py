@@ -1,5 +1,8 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.db.models import Log
+from app.db.models import Log, User
+from app.crud.pagination import iter_keyset
+from app.crud.users import filter_by_bot
 from datetime import datetime
 
 
@@ -44,4 +47,80 @@ def update_log_status(db: Session, log_id: int, status: str, timestamp_field: st
 
         db.commit()
         db.refresh(db_log)
-    return db_log
\ No newline at end of file
+    return db_log
+
+
+def bulk_create_logs(db: Session, logs_data: list):
+    """批量创建日志
+
+    使用一条多行 INSERT 写入，不经过 ORM 对象，会话的标识映射不会随行数增长。
+    """
+    if not logs_data:
+        return 0
+    # executemany 要求每行字段一致，缺失的字段补 None
+    columns = set().union(*logs_data)
+    rows = [{column: data.get(column) for column in columns} for data in logs_data]
+    db.execute(Log.__table__.insert(), rows)
+    db.commit()
+    return len(rows)
+
+
+def iter_logs(db: Session, push_id: int = None, user_id: int = None, status: str = None,
+              batch_size: int = 1000):
+    """流式返回所有匹配的日志，不受 get_logs 默认 limit 的限制
+
+    按 log_id 键集分页，适用于删除、导出等需要覆盖整个推送的内部批量操作。
+    """
+    query = db.query(Log)
+    if push_id:
+        query = query.filter(Log.push_id == push_id)
+    if user_id:
+        query = query.filter(Log.user_id == user_id)
+    if status:
+        query = query.filter(Log.status == status)
+
+    # iter_keyset 返回的日志已从会话中移除，会话的标识映射不会持续增长
+    return iter_keyset(query, Log.log_id, batch_size)
+
+
+def iter_deletable_messages(db: Session, push_id: int, batch_size: int = 1000, bot_index: int = None):
+    """逐个返回推送中尚未撤回的消息 (log_id, message_id, telegram_id)
+
+    日志与用户在一条查询中关联，按 log_id 键集分页，每批最多 batch_size 行；
+    指定 bot_index 时只返回由该 Bot 发送的消息（按日志记录的发送 Bot，而不是用户当前所属的 Bot）。
+    """
+    query = (
+        db.query(Log.log_id, Log.message_id, User.telegram_id)
+        .join(User, User.user_id == Log.user_id)
+        .filter(
+            Log.push_id == push_id,
+            Log.status == "sent",
+            Log.message_id != None,
+            Log.deleted_at == None,
+        )
+    )
+    query = filter_by_bot(query, bot_index, Log.bot_index)
+    return iter_keyset(query, Log.log_id, batch_size)
+
+
+def mark_logs_deleted(db: Session, log_ids: list):
+    """批量标记日志对应的消息已撤回"""
+    if not log_ids:
+        return 0
+    updated = (
+        db.query(Log)
+        .filter(Log.log_id.in_(log_ids))
+        .update({Log.deleted_at: datetime.now()}, synchronize_session=False)
+    )
+    db.commit()
+    return updated
+
+
+def get_deletion_progress(db: Session, push_id: int):
+    """返回推送中可撤回的消息总数和已撤回数量"""
+    total, deleted = (
+        db.query(func.count(Log.log_id), func.count(Log.deleted_at))
+        .filter(Log.push_id == push_id, Log.status == "sent", Log.message_id != None)
+        .one()
+    )
+    return total or 0, deleted or 0
\ No newline at end of file
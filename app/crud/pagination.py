@@ -0,0 +1,31 @@
+from sqlalchemy import inspect
+
+
+def iter_keyset(query, key_column, batch_size: int = 1000):
+    """按 key_column 键集分页遍历查询结果，逐行返回
+
+    每批使用 WHERE key > :last ORDER BY key LIMIT :batch_size，
+    不使用 OFFSET，内存中只保留一批数据，也不会截断结果。
+    查询的结果行需要包含 key_column 对应的字段。
+
+    每读取一批就提交会话结束读事务，遍历持续数小时（如大推送的发送）也不会一直占用同一个读视图，
+    InnoDB 可以及时清理 undo 日志。返回的 ORM 对象已从会话中移除，提交时不会过期。
+    """
+    session = query.session
+    key_name = key_column.key
+    last_key = None
+    while True:
+        batch_query = query
+        if last_key is not None:
+            batch_query = batch_query.filter(key_column > last_key)
+        rows = batch_query.order_by(key_column).limit(batch_size).all()
+        if rows and inspect(rows[0], raiseerr=False) is not None:
+            for row in rows:
+                session.expunge(row)
+        session.commit()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_key = getattr(rows[-1], key_name)
\ No newline at end of file
@@ -0,0 +1,211 @@
+from sqlalchemy import or_, and_, exists, case
+from sqlalchemy.orm import Session
+from app.db.models import Push, PushPartition
+from app.crud.pushs import priority_rank
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_partitions(db: Session, push_id: int):
+    """获取推送的所有分区"""
+    return (
+        db.query(PushPartition)
+        .filter(PushPartition.push_id == push_id)
+        .order_by(PushPartition.partition_no)
+        .all()
+    )
+
+
+def create_partitions(db: Session, push_id: int, bounds: list):
+    """为推送创建分区，bounds 为 [(lo_user_id, hi_user_id), ...]
+
+    已存在分区时（重新发送）不再创建，而是把已结束的分区重新置为等待中，
+    续发时已发送成功的用户会被跳过。返回分区数量。
+    """
+    try:
+        existing = db.query(PushPartition.partition_id).filter(PushPartition.push_id == push_id).count()
+        if existing:
+            db.query(PushPartition).filter(
+                PushPartition.push_id == push_id,
+                PushPartition.status.in_(["done", "failed"]),
+            ).update({
+                PushPartition.status: "pending",
+                PushPartition.attempts: 0,
+                PushPartition.worker_id: None,
+                PushPartition.lease_expires_at: None,
+                PushPartition.error_message: None,
+            }, synchronize_session=False)
+            db.commit()
+            return existing
+        db.add_all([
+            PushPartition(push_id=push_id, partition_no=no, lo_user_id=lo, hi_user_id=hi, status="pending")
+            for no, (lo, hi) in enumerate(bounds)
+        ])
+        db.commit()
+        return len(bounds)
+    except Exception as e:
+        logger.error(f"创建推送分区失败: {e}")
+        db.rollback()
+        raise
+
+
+def claim_partition(db: Session, worker_id: str, lease_seconds: int, max_attempts: int, priorities=None):
+    """领取一个等待中或租约已过期的分区
+
+    按推送优先级从高到低领取，priorities 不为空时只领取这些优先级的推送的分区。
+    使用 SELECT ... FOR UPDATE SKIP LOCKED，多个节点上的 worker 同时领取不会冲突。
+    """
+    now = datetime.now()
+    try:
+        query = (
+            db.query(PushPartition)
+            .join(Push, Push.push_id == PushPartition.push_id)
+            .filter(
+                or_(
+                    PushPartition.status == "pending",
+                    and_(PushPartition.status == "running", PushPartition.lease_expires_at < now),
+                ),
+                PushPartition.attempts < max_attempts,
+            )
+        )
+        if priorities:
+            query = query.filter(Push.priority.in_(priorities))
+        db_partition = (
+            query
+            .order_by(priority_rank(), PushPartition.partition_id)
+            .with_for_update(skip_locked=True, of=PushPartition)
+            .first()
+        )
+        if db_partition is None:
+            db.commit()
+            return None
+
+        db_partition.status = "running"
+        db_partition.worker_id = worker_id
+        db_partition.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        db_partition.attempts += 1
+        db.commit()
+        db.refresh(db_partition)
+        return db_partition
+    except Exception as e:
+        logger.error(f"领取推送分区失败: {e}")
+        db.rollback()
+        raise
+
+
+def renew_partition(db: Session, partition_id: int, worker_id: str, lease_seconds: int,
+                    sent: int = 0, failed: int = 0):
+    """续约并累加分区进度，返回 False 表示租约已被其他 worker 接管"""
+    try:
+        updated = (
+            db.query(PushPartition)
+            .filter(
+                PushPartition.partition_id == partition_id,
+                PushPartition.worker_id == worker_id,
+                PushPartition.status == "running",
+            )
+            .update({
+                PushPartition.lease_expires_at: datetime.now() + timedelta(seconds=lease_seconds),
+                PushPartition.sent_count: PushPartition.sent_count + sent,
+                PushPartition.failed_count: PushPartition.failed_count + failed,
+            }, synchronize_session=False)
+        )
+        db.commit()
+        return updated > 0
+    except Exception as e:
+        logger.error(f"分区续约失败: {e}")
+        db.rollback()
+        return True
+
+
+def finish_partition(db: Session, partition_id: int, worker_id: str, status: str,
+                     sent: int = 0, failed: int = 0, error_message: str = None, retry: bool = False):
+    """结束分区，status 为 done、failed 或 pending（释放回队列）
+
+    释放回队列时，retry 为 True 表示出错后重试，本次执行计入重试次数；
+    否则是 worker 退出时中断，退还本次领取占用的重试次数。
+    """
+    values = {
+        PushPartition.status: status,
+        PushPartition.sent_count: PushPartition.sent_count + sent,
+        PushPartition.failed_count: PushPartition.failed_count + failed,
+        PushPartition.error_message: error_message,
+    }
+    if status == "pending":
+        values[PushPartition.worker_id] = None
+        values[PushPartition.lease_expires_at] = None
+        if not retry:
+            values[PushPartition.attempts] = PushPartition.attempts - 1
+    try:
+        db.query(PushPartition).filter(
+            PushPartition.partition_id == partition_id, PushPartition.worker_id == worker_id
+        ).update(values, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        logger.error(f"更新分区状态失败: {e}")
+        db.rollback()
+
+
+def complete_push_if_partitions_done(db: Session, push_id: int):
+    """所有分区都结束后结束推送，返回推送的新状态，未由本次调用结束时返回 None
+
+    全部分区发送完成时推送标记为已完成；有分区失败时标记为已取消，之后可以重新发送，
+    失败的分区会被重新置为等待中，已发送成功的用户会被跳过。
+    """
+    unfinished = exists().where(
+        PushPartition.push_id == push_id,
+        PushPartition.status.in_(["pending", "running"]),
+    )
+    failed = exists().where(
+        PushPartition.push_id == push_id,
+        PushPartition.status == "failed",
+    )
+    try:
+        updated = (
+            db.query(Push)
+            .filter(Push.push_id == push_id, Push.status == "sending", ~unfinished)
+            .update({
+                Push.status: case((failed, "cancelled"), else_="completed"),
+                Push.updated_at: datetime.now(),
+            }, synchronize_session=False)
+        )
+        db.commit()
+        if not updated:
+            return None
+        return db.query(Push.status).filter(Push.push_id == push_id).scalar()
+    except Exception as e:
+        logger.error(f"更新推送完成状态失败: {e}")
+        db.rollback()
+        return None
+
+
+def fail_exhausted_partitions(db: Session, max_attempts: int):
+    """把重试次数用尽、不会再被领取的分区（等待中或租约已过期）标记为失败，返回涉及的推送ID"""
+    try:
+        rows = (
+            db.query(PushPartition.partition_id, PushPartition.push_id)
+            .filter(
+                or_(
+                    PushPartition.status == "pending",
+                    and_(PushPartition.status == "running", PushPartition.lease_expires_at < datetime.now()),
+                ),
+                PushPartition.attempts >= max_attempts,
+            )
+            .all()
+        )
+        if not rows:
+            return []
+        db.query(PushPartition).filter(
+            PushPartition.partition_id.in_([row.partition_id for row in rows])
+        ).update(
+            {PushPartition.status: "failed", PushPartition.error_message: "超过最大重试次数"},
+            synchronize_session=False,
+        )
+        db.commit()
+        return sorted({row.push_id for row in rows})
+    except Exception as e:
+        logger.error(f"标记失败分区出错: {e}")
+        db.rollback()
+        return []
\ No newline at end of file
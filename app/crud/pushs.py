@@ -1,5 +1,8 @@
+from sqlalchemy import func, case
 from sqlalchemy.orm import Session
 from app.db.models import Push
+from app.core.id_set import IdSet
+from app.bot.config import TARGET_IDS_COMPACT_THRESHOLD, PUSH_PRIORITIES
 from datetime import datetime
 import json
 import logging
@@ -7,6 +10,12 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def priority_rank():
+    """推送优先级的排序表达式，优先级越高值越小"""
+    return case({name: rank for rank, name in enumerate(PUSH_PRIORITIES)}, value=Push.priority,
+                else_=len(PUSH_PRIORITIES))
+
+
 def get_push(db: Session, push_id: int):
     """获取特定推送"""
     return db.query(Push).filter(Push.push_id == push_id).first()
@@ -20,14 +29,36 @@ def get_pushes(db: Session, skip: int = 0, limit: int = 100, status: str = None)
     return query.order_by(Push.created_at.desc()).offset(skip).limit(limit).all()
 
 
+def _encode_target_user_ids(push_data: dict):
+    """序列化目标用户ID：数量超过阈值时使用紧凑编码，否则保存为 JSON 字符串"""
+    user_ids = push_data.get("target_user_ids")
+    if not isinstance(user_ids, list):
+        return
+    push_data["target_user_count"] = len(set(user_ids))
+    if len(user_ids) > TARGET_IDS_COMPACT_THRESHOLD:
+        push_data["target_user_set"] = IdSet.encode(user_ids)
+        push_data["target_user_ids"] = None
+    else:
+        push_data["target_user_set"] = None
+        push_data["target_user_ids"] = json.dumps(user_ids)
+
+
+def describe_push_data(push_data: dict) -> dict:
+    """用于日志的推送数据，目标用户ID列表只记录数量，避免大列表写满日志"""
+    described = dict(push_data)
+    user_ids = described.get("target_user_ids")
+    if isinstance(user_ids, list):
+        described["target_user_ids"] = f"<{len(user_ids)} 个用户ID>"
+    return described
+
+
 def create_push(db: Session, push_data: dict):
     """创建新推送"""
-    logger.info(f"创建推送数据: {push_data}")
+    logger.info(f"创建推送数据: {describe_push_data(push_data)}")
 
     try:
-        # 确保target_user_ids是JSON字符串
-        if "target_user_ids" in push_data and isinstance(push_data["target_user_ids"], list):
-            push_data["target_user_ids"] = json.dumps(push_data["target_user_ids"])
+        # 确保target_user_ids是JSON字符串或紧凑编码
+        _encode_target_user_ids(push_data)
 
         # 确保buttons是JSON字符串
         if "buttons" in push_data and push_data["buttons"] and not isinstance(push_data["buttons"], str):
@@ -51,13 +82,17 @@ def update_push(db: Session, push_id: int, push_data: dict):
     if db_push:
         try:
             # 处理target_user_ids
-            if "target_user_ids" in push_data and isinstance(push_data["target_user_ids"], list):
-                push_data["target_user_ids"] = json.dumps(push_data["target_user_ids"])
+            _encode_target_user_ids(push_data)
 
             # 处理buttons
             if "buttons" in push_data and push_data["buttons"] and not isinstance(push_data["buttons"], str):
                 push_data["buttons"] = json.dumps(push_data["buttons"])
 
+            # 媒体变化后，之前上传得到的 file_id 失效
+            if any(key in push_data and push_data[key] != getattr(db_push, key)
+                   for key in ("media_url", "content_type")):
+                db_push.media_file_id = None
+
             # 更新字段
             for key, value in push_data.items():
                 setattr(db_push, key, value)
@@ -105,17 +140,99 @@ def update_push_status(db: Session, push_id: int, status: str):
     return None
 
 
-def increment_sent_count(db: Session, push_id: int):
-    """增加发送计数"""
-    db_push = get_push(db, push_id)
-    if db_push:
-        try:
-            db_push.sent_count += 1
-            db.commit()
-            db.refresh(db_push)
-            return db_push
-        except Exception as e:
-            logger.error(f"增加发送计数失败: {e}")
-            db.rollback()
-            raise
-    return None
\ No newline at end of file
+def add_push_counts(db: Session, push_id: int, sent: int = 0, failed: int = 0):
+    """原子地累加推送的成功/失败计数
+
+    使用 UPDATE ... SET sent_count = sent_count + :n，由数据库完成累加，
+    多个发送者同时更新同一推送也不会丢失计数。
+    """
+    values = {}
+    if sent:
+        values[Push.sent_count] = func.coalesce(Push.sent_count, 0) + sent
+    if failed:
+        values[Push.failed_count] = func.coalesce(Push.failed_count, 0) + failed
+    if not values:
+        return 0
+    try:
+        updated = db.query(Push).filter(Push.push_id == push_id).update(values, synchronize_session=False)
+        db.commit()
+        return updated
+    except Exception as e:
+        logger.error(f"累加推送计数失败: {e}")
+        db.rollback()
+        raise
+
+
+def set_media_file_id(db: Session, push_id: int, file_id: str):
+    """保存推送媒体的 file_id"""
+    try:
+        db.query(Push).filter(Push.push_id == push_id).update(
+            {Push.media_file_id: file_id}, synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        logger.error(f"保存媒体 file_id 失败: {e}")
+        db.rollback()
+
+
+def get_due_pushes(db: Session, before: datetime, limit: int = 500):
+    """获取 before 之前到期的定时推送，返回 (push_id, scheduled_time)，按时间排序"""
+    return (
+        db.query(Push.push_id, Push.scheduled_time)
+        .filter(
+            Push.status == "scheduled",
+            Push.scheduled_time != None,
+            Push.scheduled_time <= before,
+        )
+        .order_by(Push.scheduled_time)
+        .limit(limit)
+        .all()
+    )
+
+
+# 可以开始发送的推送状态（已取消的推送可以重新发送，续发时跳过已发送的用户）
+CLAIMABLE_STATUSES = ("draft", "scheduled", "cancelled")
+
+
+def claim_push(db: Session, push_id: int, token: str, statuses=CLAIMABLE_STATUSES):
+    """原子地把推送改为发送中并记录所有者令牌，返回是否成功
+
+    使用 UPDATE ... WHERE status IN (...) 比较并设置，重复点击、并发请求或
+    多个进程同时领取同一推送时只有一个能成功。
+    """
+    try:
+        updated = (
+            db.query(Push)
+            .filter(Push.push_id == push_id, Push.status.in_(statuses))
+            .update({Push.status: "sending", Push.send_token: token, Push.updated_at: datetime.now()},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return updated > 0
+    except Exception as e:
+        logger.error(f"领取推送失败: {e}")
+        db.rollback()
+        raise
+
+
+def claim_scheduled_push(db: Session, push_id: int, token: str):
+    """把到期的定时推送原子地改为发送中，返回是否成功"""
+    return claim_push(db, push_id, token, statuses=("scheduled",))
+
+
+def release_push(db: Session, push_id: int, token: str, status: str):
+    """发送结束或放弃时更新推送状态，只有持有令牌的发送才能修改，返回是否成功
+
+    token 为空时（升级前入队的任务）不检查令牌。
+    """
+    query = db.query(Push).filter(Push.push_id == push_id, Push.status == "sending")
+    if token is not None:
+        query = query.filter(Push.send_token == token)
+    try:
+        updated = query.update({Push.status: status, Push.updated_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+        return updated > 0
+    except Exception as e:
+        logger.error(f"更新推送状态失败: {e}")
+        db.rollback()
+        raise
\ No newline at end of file
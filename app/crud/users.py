@@ -1,5 +1,8 @@
+from sqlalchemy import exists, func
 from sqlalchemy.orm import Session
-from app.db.models import User
+from app.db.models import User, Log
+from app.crud.pagination import iter_keyset
+from app.bot.config import BOT_TOKENS
 from datetime import datetime
 
 def get_user_by_telegram_id(db: Session, telegram_id: int):
@@ -44,4 +47,95 @@ def deactivate_user(db: Session, user_id: int):
         db_user.updated_at = datetime.now()
         db.commit()
         db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+def deactivate_users(db: Session, user_ids):
+    """批量停用用户，返回实际停用的数量"""
+    updated = (
+        db.query(User)
+        .filter(User.user_id.in_(user_ids), User.is_active == True)
+        .update({User.is_active: False, User.updated_at: datetime.now()}, synchronize_session=False)
+    )
+    db.commit()
+    return updated
+
+
+# 按用户ID查询接收者时每条 IN 查询的ID数量
+RECIPIENT_BATCH_SIZE = 2000
+
+
+def iter_recipient_chunks(db: Session, chunks, skip_sent_push_id: int = None, fields=(), bot_index: int = None):
+    """按已分好批的有序用户ID逐批查询活跃用户，返回 (user_id, telegram_id, *fields)
+
+    每批使用一条 IN 查询，只取发送需要的字段，不创建 ORM 对象；
+    fields 为个性化模板额外需要的用户字段，如 ("first_name",)。
+    指定 skip_sent_push_id 时跳过该推送已发送成功的用户，用于中断后续发；
+    指定 bot_index 时只返回由该 Bot 发送的用户。
+    """
+    columns = [User.user_id, User.telegram_id] + [getattr(User, field) for field in fields]
+    for chunk in chunks:
+        query = (
+            db.query(*columns)
+            .filter(User.user_id.in_(chunk), User.is_active == True)
+        )
+        query = filter_by_bot(query, bot_index)
+        if skip_sent_push_id is not None:
+            query = query.filter(~_sent_log_exists(skip_sent_push_id))
+        rows = query.order_by(User.user_id).all()
+        # 每批读取后结束读事务，长时间的发送不会一直占用同一个读视图
+        db.commit()
+        yield from rows
+
+
+def filter_by_bot(query, bot_index: int = None, column=User.bot_index):
+    """只保留由第 bot_index 个 Bot 处理的行；Bot 序号已不在 Bot 池中的行由第一个 Bot 处理
+
+    column 为记录 Bot 序号的列，默认为用户所属的 Bot。
+    """
+    if bot_index is None or len(BOT_TOKENS) <= 1:
+        return query
+    if bot_index == 0:
+        return query.filter(column.notin_(range(1, len(BOT_TOKENS))))
+    return query.filter(column == bot_index)
+
+
+def _segment_query(db: Session, columns, since=None, lo_user_id: int = None, hi_user_id: int = None,
+                   bot_index: int = None):
+    """活跃用户分群查询：since 为最近交互时间下限，[lo_user_id, hi_user_id) 为用户ID范围"""
+    query = filter_by_bot(db.query(*columns).filter(User.is_active == True), bot_index)
+    if since is not None:
+        query = query.filter(User.last_interaction_at >= since)
+    if lo_user_id is not None:
+        query = query.filter(User.user_id >= lo_user_id)
+    if hi_user_id is not None:
+        query = query.filter(User.user_id < hi_user_id)
+    return query
+
+
+def iter_segment_recipients(db: Session, since=None, lo_user_id: int = None, hi_user_id: int = None,
+                            batch_size: int = 2000, skip_sent_push_id: int = None, fields=(), bot_index: int = None):
+    """按 user_id 键集分页流式返回分群内的活跃用户 (user_id, telegram_id, *fields)"""
+    columns = [User.user_id, User.telegram_id] + [getattr(User, field) for field in fields]
+    query = _segment_query(db, columns, since, lo_user_id, hi_user_id, bot_index)
+    if skip_sent_push_id is not None:
+        query = query.filter(~_sent_log_exists(skip_sent_push_id))
+    return iter_keyset(query, User.user_id, batch_size)
+
+
+def count_segment(db: Session, since=None):
+    """统计分群内的活跃用户数量"""
+    return _segment_query(db, [func.count(User.user_id)], since).scalar() or 0
+
+
+def get_segment_id_range(db: Session, since=None):
+    """返回分群内活跃用户的 (最小用户ID, 最大用户ID)"""
+    return _segment_query(db, [func.min(User.user_id), func.max(User.user_id)], since).one()
+
+
+def _sent_log_exists(push_id: int):
+    """该用户在此推送下存在发送成功日志的 EXISTS 子查询，走 (push_id, user_id, status) 索引"""
+    return exists().where(
+        Log.push_id == push_id,
+        Log.user_id == User.user_id,
+        Log.status == "sent",
+    )
\ No newline at end of file
@@ -1,4 +1,7 @@
-from sqlalchemy import Boolean, Column, Integer, BigInteger, String, Text, Enum, TIMESTAMP, ForeignKey, JSON
+from sqlalchemy import (
+    Boolean, Column, Integer, BigInteger, String, Text, Enum, TIMESTAMP, ForeignKey, JSON, Index, LargeBinary
+)
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -16,6 +19,12 @@ class User(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
     last_interaction_at = Column(TIMESTAMP, nullable=True)
+    bot_index = Column(Integer, nullable=False, default=0, server_default="0")  # 发送给该用户的 Bot 在 Bot 池中的序号
+
+    # 按最近交互时间统计和切分受众分群
+    __table_args__ = (
+        Index("ix_users_active_interaction", "is_active", "last_interaction_at"),
+    )
 
 class AdminUser(Base):
     __tablename__ = "admin_users"
@@ -38,18 +47,31 @@ class Push(Base):
     content = Column(Text, nullable=False)
     content_type = Column(Enum('text', 'photo', 'video', 'document', 'audio'), default='text')
     media_url = Column(String(1024))
+    media_file_id = Column(String(255), nullable=True)  # 首次发送后 Telegram 返回的文件ID
     scheduled_time = Column(TIMESTAMP, nullable=True)
     status = Column(Enum('draft', 'scheduled', 'sending', 'completed', 'cancelled'), default='draft')
+    send_token = Column(String(32), nullable=True)  # 当前发送的所有者令牌，领取推送时生成
+    priority = Column(Enum('urgent', 'normal', 'bulk'), nullable=False, default='normal', server_default='normal')  # 发送优先级
     target_user_ids = Column(JSON)
+    # 大量指定用户的紧凑编码（见 app.core.id_set），此时 target_user_ids 为空；访问时才从数据库读取
+    target_user_set = deferred(Column(LargeBinary(16777215), nullable=True))
+    target_user_count = Column(Integer, nullable=True)
+    audience = Column(JSON, nullable=True)  # 受众定义，如 {"type": "active_since", "since": "..."}，为空时使用 target_user_ids
     created_by = Column(Integer, ForeignKey("admin_users.admin_id"), nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
     sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
     delivered_count = Column(Integer, default=0)
     read_count = Column(Integer, default=0)
     use_markdown = Column(Boolean, default=False)  # 新字段
     buttons = Column(Text, nullable=True)  # 新字段
 
+    __table_args__ = (
+        # 调度器按 (status, scheduled_time) 查询到期的定时推送
+        Index("ix_pushs_status_scheduled", "status", "scheduled_time"),
+    )
+
 class Log(Base):
     __tablename__ = "logs"
 
@@ -62,4 +84,55 @@ class Log(Base):
     delivered_at = Column(TIMESTAMP, nullable=True)
     read_at = Column(TIMESTAMP, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
-    message_id = Column(BigInteger, nullable=True)  # 添加消息ID字段
\ No newline at end of file
+    message_id = Column(BigInteger, nullable=True)  # 添加消息ID字段
+    deleted_at = Column(TIMESTAMP, nullable=True)  # 消息被撤回的时间
+    bot_index = Column(Integer, nullable=False, default=0, server_default="0")  # 发送该消息的 Bot 在 Bot 池中的序号
+
+    __table_args__ = (
+        # 续发时按 (push_id, user_id) 判断用户是否已发送成功
+        Index("ix_logs_push_user_status", "push_id", "user_id", "status"),
+        # 按推送分批遍历日志（log_id 键集分页）
+        Index("ix_logs_push_log", "push_id", "log_id"),
+    )
+
+class PushJob(Base):
+    __tablename__ = "push_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    push_id = Column(Integer, ForeignKey("pushs.push_id"), nullable=False)
+    kind = Column(String(32), nullable=False, default='send')  # 任务类型
+    token = Column(String(32), nullable=True)  # 发送任务对应的推送所有者令牌
+    status = Column(Enum('pending', 'running', 'done', 'failed'), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(191), nullable=True)  # 当前领取任务的 worker
+    heartbeat_at = Column(TIMESTAMP, nullable=True)  # worker 最近一次心跳
+    error_message = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_push_jobs_status_job", "status", "job_id"),
+    )
+
+class PushPartition(Base):
+    __tablename__ = "push_partitions"
+
+    partition_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    push_id = Column(Integer, ForeignKey("pushs.push_id"), nullable=False)
+    partition_no = Column(Integer, nullable=False)
+    lo_user_id = Column(Integer, nullable=False)  # 分区包含的用户ID范围 [lo_user_id, hi_user_id)
+    hi_user_id = Column(Integer, nullable=False)
+    status = Column(Enum('pending', 'running', 'done', 'failed'), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(191), nullable=True)  # 当前持有租约的 worker
+    lease_expires_at = Column(TIMESTAMP, nullable=True)  # 租约到期后可被其他 worker 接管
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_push_partitions_status_lease", "status", "lease_expires_at"),
+        Index("ix_push_partitions_push", "push_id", "partition_no"),
+    )
\ No newline at end of file
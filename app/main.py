@@ -1,12 +1,18 @@
 import asyncio
+import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 from contextlib import asynccontextmanager
 from app.api import api_router
 from app.db.models import Base
 from app.db.session import engine
-from app.bot.bot import setup_bot
+from app.bot.bot import setup_bots, start_bot, stop_bot
+from app.bot.client import init_bot, shutdown_bot
+from app.worker import PushWorker
+from app.services.scheduler import scheduler
+from app.core import metrics
 
 # 配置日志
 logging.basicConfig(
@@ -18,8 +24,14 @@ logger = logging.getLogger(__name__)
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
-# 创建 Bot 实例
-bot_app = setup_bot()
+# 为 Bot 池中的每个 Bot 创建应用实例
+bot_apps = setup_bots()
+
+# 是否在 API 进程内运行推送 worker；独立部署 `python -m app.worker` 时可以关闭
+RUN_EMBEDDED_WORKER = os.getenv("RUN_EMBEDDED_WORKER", "true").lower() in ("1", "true", "yes")
+
+# 是否在 API 进程内运行定时推送调度器
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() in ("1", "true", "yes")
 
 
 @asynccontextmanager
@@ -28,27 +40,51 @@ async def lifespan(app: FastAPI):
     # 启动事件
     try:
         logger.info("Starting the Telegram Bot...")
-        # 启动 Bot 并保持在后台运行
-        if bot_app:
-            await bot_app.initialize()
-            await bot_app.start()
-            await bot_app.updater.start_polling()
+        # 初始化共享的 Bot 连接池，推送和删除都复用它
+        await init_bot()
+        # 启动所有 Bot 并保持在后台运行（长轮询或注册 webhook）
+        for bot_app in bot_apps:
+            await start_bot(bot_app)
     except Exception as e:
         logger.error(f"Error starting Telegram Bot: {e}")
 
+    # 启动内置的推送 worker
+    worker = None
+    worker_task = None
+    if RUN_EMBEDDED_WORKER:
+        worker = PushWorker()
+        worker_task = asyncio.create_task(worker.run())
+
+    # 启动定时推送调度器
+    scheduler_task = None
+    if RUN_SCHEDULER:
+        scheduler_task = asyncio.create_task(scheduler.run())
+
     yield  # 这里是应用运行时
 
+    # 停止定时推送调度器
+    if scheduler_task:
+        scheduler.stop()
+        await asyncio.gather(scheduler_task, return_exceptions=True)
+
+    # 停止推送 worker，未完成的任务释放回队列
+    if worker:
+        logger.info("Stopping the push worker...")
+        worker.stop()
+        await asyncio.gather(worker_task, return_exceptions=True)
+
     # 关闭事件
     try:
         logger.info("Stopping the Telegram Bot...")
-        # 停止 Bot
-        if bot_app:
-            await bot_app.updater.stop()
-            await bot_app.stop()
-            await bot_app.shutdown()
+        # 停止所有 Bot
+        for bot_app in bot_apps:
+            await stop_bot(bot_app)
     except Exception as e:
         logger.error(f"Error stopping Telegram Bot: {e}")
 
+    # 关闭共享的连接池
+    await shutdown_bot()
+
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -65,6 +101,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录每个路由的请求耗时
+app.add_middleware(metrics.MetricsMiddleware)
+
 # 注册 API 路由
 app.include_router(api_router, prefix="/api")
 
@@ -74,6 +113,12 @@ def read_root():
     return {"message": "Telegram Push Bot API"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """Prometheus 格式的指标（包括内置 worker 的发送指标）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # 如果直接运行此文件
 if __name__ == "__main__":
     import uvicorn
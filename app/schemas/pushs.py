@@ -1,7 +1,13 @@
 from pydantic import BaseModel
-from typing import Optional, List, Union, Dict, Any
+from typing import Optional, List, Union, Dict, Any, Literal
 from datetime import datetime
 
+class Audience(BaseModel):
+    # explicit: target_user_ids 中的指定用户；all_active: 全部活跃用户；
+    # active_since: since 之后有过交互的活跃用户
+    type: Literal["explicit", "all_active", "active_since"] = "explicit"
+    since: Optional[datetime] = None
+
 class PushBase(BaseModel):
     title: str
     content: str
@@ -10,9 +16,12 @@ class PushBase(BaseModel):
     scheduled_time: Optional[datetime] = None
     use_markdown: Optional[bool] = False
     buttons: Optional[str] = None  # JSON 字符串
+    # 发送优先级：同时发送的推送按优先级权重分享发送速率，worker 优先领取高优先级的推送
+    priority: Literal["urgent", "normal", "bulk"] = "normal"
 
 class PushCreate(PushBase):
-    target_user_ids: List[int]
+    target_user_ids: Optional[List[int]] = None
+    audience: Optional[Audience] = None
     status: Optional[str] = "draft"
 
 class PushUpdate(BaseModel):
@@ -23,17 +32,23 @@ class PushUpdate(BaseModel):
     scheduled_time: Optional[datetime] = None
     status: Optional[str] = None
     target_user_ids: Optional[List[int]] = None
+    audience: Optional[Audience] = None
     use_markdown: Optional[bool] = None
     buttons: Optional[str] = None
+    priority: Optional[Literal["urgent", "normal", "bulk"]] = None
 
 class Push(PushBase):
     push_id: int
     status: str
-    target_user_ids: Union[List[int], str]
+    target_user_ids: Optional[Union[List[int], str]] = None
+    target_user_count: Optional[int] = None
+    audience: Optional[Dict[str, Any]] = None
     created_by: Optional[int] = None
     created_at: datetime
     updated_at: datetime
+    media_file_id: Optional[str] = None
     sent_count: int
+    failed_count: Optional[int] = 0
     delivered_count: int
     read_count: int
 
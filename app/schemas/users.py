@@ -23,6 +23,7 @@ class User(UserBase):
     created_at: datetime
     updated_at: datetime
     last_interaction_at: Optional[datetime] = None
+    bot_index: int = 0  # 发送给该用户的 Bot 在 Bot 池中的序号
 
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,98 @@
+import json
+import logging
+from datetime import datetime
+from app.core.id_set import IdSet
+from app.crud import users as users_crud
+
+logger = logging.getLogger(__name__)
+
+# 受众类型：explicit 为 target_user_ids 中的指定用户，
+# all_active 为全部活跃用户，active_since 为 since 之后有过交互的活跃用户
+AUDIENCE_TYPES = ("explicit", "all_active", "active_since")
+
+
+def get_audience(push) -> dict:
+    """返回推送的受众定义，旧推送没有受众时视为指定用户"""
+    audience = getattr(push, "audience", None)
+    if isinstance(audience, str):
+        audience = json.loads(audience)
+    return audience or {"type": "explicit"}
+
+
+def load_target_user_ids(push):
+    """解析推送的目标用户ID列表，格式错误时抛出 ValueError"""
+    if isinstance(push.target_user_ids, str):
+        try:
+            return json.loads(push.target_user_ids)
+        except json.JSONDecodeError:
+            raise ValueError(f"解析目标用户ID失败: {push.target_user_ids}")
+    return push.target_user_ids or []
+
+
+def load_target_id_set(push) -> IdSet:
+    """返回推送指定用户的 IdSet：紧凑编码直接使用，JSON 列表（数量较少）在内存中编码"""
+    if push.target_user_set:
+        return IdSet(push.target_user_set)
+    return IdSet.from_ids(load_target_user_ids(push))
+
+
+def _get_since(audience: dict):
+    """active_since 受众的时间下限"""
+    if audience["type"] != "active_since":
+        return None
+    since = audience.get("since")
+    return datetime.fromisoformat(since) if isinstance(since, str) else since
+
+
+def iter_recipients(db, push, lo_user_id: int = None, hi_user_id: int = None,
+                    skip_sent_push_id: int = None, fields=(), bot_index: int = None):
+    """在发送时流式解析推送的接收者，可限定用户ID范围 [lo_user_id, hi_user_id) 和发送的 Bot"""
+    audience = get_audience(push)
+    if audience["type"] == "explicit":
+        # 只解码分区范围内的ID，逐批查询
+        chunks = load_target_id_set(push).chunks(users_crud.RECIPIENT_BATCH_SIZE, lo_user_id, hi_user_id)
+        return users_crud.iter_recipient_chunks(
+            db, chunks, skip_sent_push_id=skip_sent_push_id, fields=fields, bot_index=bot_index
+        )
+    return users_crud.iter_segment_recipients(
+        db, since=_get_since(audience), lo_user_id=lo_user_id, hi_user_id=hi_user_id,
+        skip_sent_push_id=skip_sent_push_id, fields=fields, bot_index=bot_index
+    )
+
+
+def count_recipients(db, push) -> int:
+    """估计接收者数量（指定用户时不区分是否活跃）"""
+    audience = get_audience(push)
+    if audience["type"] == "explicit":
+        if push.target_user_count is not None:
+            return push.target_user_count
+        return len(load_target_user_ids(push))
+    return users_crud.count_segment(db, since=_get_since(audience))
+
+
+def split_partitions(db, push, partition_size: int):
+    """把接收者按用户ID切分为 [lo, hi) 区间，每个区间约 partition_size 个用户"""
+    audience = get_audience(push)
+    if audience["type"] == "explicit":
+        # 每隔 partition_size 个ID取一个边界，最后一个区间到最大ID为止
+        bounds = []
+        lo = last = None
+        for i, user_id in enumerate(load_target_id_set(push)):
+            if i % partition_size == 0:
+                if lo is not None:
+                    bounds.append((lo, user_id))
+                lo = user_id
+            last = user_id
+        if lo is not None:
+            bounds.append((lo, last + 1))
+        return bounds
+
+    # 分群受众按用户ID范围等宽切分（用户ID自增，分布基本均匀）
+    since = _get_since(audience)
+    count = users_crud.count_segment(db, since=since)
+    min_id, max_id = users_crud.get_segment_id_range(db, since=since)
+    if not count:
+        return []
+    partitions = -(-count // partition_size)
+    width = -(-(max_id + 1 - min_id) // partitions)
+    return [(lo, min(lo + width, max_id + 1)) for lo in range(min_id, max_id + 1, width)]
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+from app.db.session import SessionLocal
+from app.crud import pushs as pushs_crud
+from app.bot.config import COUNTER_FLUSH_INTERVAL
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PushCounters:
+    """推送计数聚合器
+
+    发送协程只在内存中累加成功/失败数量，每隔 flush_interval 秒
+    用一条原子 UPDATE 把增量写入数据库；退出 async with 时写入剩余增量。
+    """
+
+    def __init__(self, flush_interval: float = COUNTER_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._db = None
+        self._task = None
+
+    async def __aenter__(self):
+        self._db = SessionLocal()
+        self._task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            self.flush()
+        finally:
+            self._db.close()
+
+    def add(self, push_id: int, sent: int = 0, failed: int = 0):
+        """累加计数，不访问数据库"""
+        counts = self._pending.setdefault(push_id, [0, 0])
+        counts[0] += sent
+        counts[1] += failed
+
+    def flush(self):
+        """把累计的增量写入数据库"""
+        pending, self._pending = self._pending, {}
+        for push_id, (sent, failed) in pending.items():
+            started = time.monotonic()
+            try:
+                pushs_crud.add_push_counts(self._db, push_id, sent=sent, failed=failed)
+                metrics.DB_FLUSH_LATENCY.observe(time.monotonic() - started, "counters")
+                metrics.DB_FLUSH_ROWS.inc("counters")
+            except Exception as e:
+                logger.error(f"写入推送 {push_id} 计数失败，稍后重试: {e}")
+                self.add(push_id, sent, failed)
+
+    async def _flush_periodically(self):
+        """定时写入，让发送过程中的进度可见"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import logging
+from app.db.session import SessionLocal
+from app.crud import pushs as pushs_crud
+from app.bot.config import (
+    BOT_TOKENS, PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, PUSH_PER_CHAT_RATE, PUSH_PARTITION_SIZE
+)
+from app.services import audience as audience_service
+from app.services.push_template import compile_push
+from app.services.rate_limiter import SimulatedClock, TokenBucket, PerChatLimiter
+
+logger = logging.getLogger(__name__)
+
+# Telegram 的文本消息和媒体说明长度上限
+MESSAGE_MAX_LENGTH = 4096
+CAPTION_MAX_LENGTH = 1024
+# Telegram 对群发的大致限制（条/秒），超过时容易收到 RetryAfter
+TELEGRAM_BROADCAST_LIMIT = 30
+# 返回的校验失败示例数量
+MAX_FAILURE_SAMPLES = 20
+
+
+def _validate(compiled, text: str):
+    """检查单个接收者的消息，返回失败原因，可以发送时返回 None"""
+    if compiled.is_media:
+        if len(text) > CAPTION_MAX_LENGTH:
+            return f"媒体说明超过 {CAPTION_MAX_LENGTH} 字符"
+    elif not text.strip():
+        return "消息内容为空"
+    elif len(text) > MESSAGE_MAX_LENGTH:
+        return f"消息超过 {MESSAGE_MAX_LENGTH} 字符"
+    return None
+
+
+def dry_run_push(push_id: int) -> dict:
+    """模拟发送推送，不调用 Telegram，也不写入日志和计数
+
+    与真实发送一样解析受众（跳过已发送成功的用户）、编译推送、渲染每个接收者的内容，
+    并让每条消息依次通过所属 Bot 的使用模拟时钟的全局令牌桶和单聊天限流器，
+    由此得到按当前限流配置发送完所有消息的预计耗时（Bot 池中的 Bot 并行发送，取最慢的一个）。
+    模拟在 API 进程中进行，不读取也不创建实际发送使用的限流器，预计耗时不包含 Telegram 的响应延迟。
+    """
+    db = SessionLocal()
+    try:
+        push = pushs_crud.get_push(db, push_id)
+        if push is None:
+            raise ValueError(f"推送不存在: {push_id}")
+
+        compiled = compile_push(push)
+        warnings = []
+        if push.buttons and compiled.keyboard is None:
+            warnings.append("按钮数据无效，发送时将不带按钮")
+        if compiled.is_media and not (push.media_url or push.media_file_id):
+            warnings.append(f"{compiled.media_label}推送缺少媒体URL")
+        if PUSH_GLOBAL_RATE > TELEGRAM_BROADCAST_LIMIT:
+            warnings.append(f"全局发送速率 {PUSH_GLOBAL_RATE} 条/秒 超过 Telegram 约 {TELEGRAM_BROADCAST_LIMIT} 条/秒的限制，可能被限流")
+
+        recipient_count = audience_service.count_recipients(db, push)
+        partition_count = len(audience_service.split_partitions(db, push, PUSH_PARTITION_SIZE)) \
+            if recipient_count > PUSH_PARTITION_SIZE else 0
+
+        bot_count = len(BOT_TOKENS)
+        clocks = [SimulatedClock() for _ in range(bot_count)]
+        buckets = [TokenBucket(PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, clock=clock) for clock in clocks]
+        per_chats = [PerChatLimiter(PUSH_PER_CHAT_RATE, clock=clock) for clock in clocks]
+        sendable_by_bot = [0] * bot_count
+
+        failures = {}
+        samples = []
+        fields = compiled.fields + ("bot_index",) if bot_count > 1 else compiled.fields
+        recipients = audience_service.iter_recipients(db, push, skip_sent_push_id=push_id, fields=fields)
+        for user in recipients:
+            error = _validate(compiled, compiled.render(user))
+            if error is not None:
+                failures[error] = failures.get(error, 0) + 1
+                if len(samples) < MAX_FAILURE_SAMPLES:
+                    samples.append({"user_id": user.user_id, "error": error})
+                continue
+            # 所属 Bot 已不在 Bot 池中的用户由第一个 Bot 发送
+            index = user.bot_index if bot_count > 1 and 0 <= user.bot_index < bot_count else 0
+            clocks[index].advance(per_chats[index].reserve(user.telegram_id))
+            clocks[index].advance(buckets[index].reserve())
+            sendable_by_bot[index] += 1
+        sendable = sum(sendable_by_bot)
+
+        projected = max(clock.now for clock in clocks)
+
+        logger.info(f"推送 {push_id} 模拟发送: 可发送 {sendable}, 校验失败 {sum(failures.values())}, "
+                    f"预计耗时 {projected:.1f} 秒")
+        return {
+            "dry_run": True,
+            "push_id": push_id,
+            "recipient_count": recipient_count,
+            "sendable_count": sendable,
+            "validation_failures": sum(failures.values()),
+            "failure_reasons": failures,
+            "failure_samples": samples,
+            "partition_count": partition_count,
+            "bot_count": bot_count,
+            "sendable_by_bot": sendable_by_bot,
+            "global_rate": PUSH_GLOBAL_RATE * bot_count,
+            "projected_seconds": round(projected, 1),
+            "warnings": warnings,
+        }
+    finally:
+        db.close()
\ No newline at end of file
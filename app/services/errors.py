@@ -0,0 +1,71 @@
+import re
+from datetime import timedelta
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+# 这些 BadRequest 说明接收者永久无法接收消息
+RECIPIENT_ERROR_MARKERS = ("chat not found", "user not found", "user is deactivated", "bot was blocked")
+
+# 这些 BadRequest 说明媒体本身不可用（URL 无法获取、内容类型不对、file_id 无效），与接收者无关
+MEDIA_ERROR_MARKERS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "failed to get http url content",
+    "wrong type of the web page content",
+    "file is too big",
+    "invalid file http url",
+    "url host is empty",
+    "unsupported url protocol",
+    "image_process_failed",
+    "photo_invalid_dimensions",
+    "wrong padding length",
+)
+
+# 从错误信息中解析等待时间，如 "Flood control exceeded. Retry in 12 seconds"
+RETRY_AFTER_PATTERN = re.compile(r"retry (?:in|after) (\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def is_media_error(error: Exception) -> bool:
+    """判断异常是否说明媒体本身无法发送（如 URL 无法获取、文件格式错误）
+
+    只匹配已知的媒体错误；其他 BadRequest（如说明文字解析失败、无权发言）只影响当前接收者。
+    """
+    if not isinstance(error, BadRequest):
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in MEDIA_ERROR_MARKERS)
+
+
+def get_retry_after(error: Exception):
+    """返回限流错误要求等待的秒数，不是限流错误时返回 None"""
+    if isinstance(error, RetryAfter):
+        retry_after = error.retry_after
+        if isinstance(retry_after, timedelta):
+            return retry_after.total_seconds()
+        return float(retry_after)
+    match = RETRY_AFTER_PATTERN.search(str(error))
+    if match and ("flood" in str(error).lower() or "too many requests" in str(error).lower()):
+        return float(match.group(1))
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """判断异常是否为可重试的临时错误（超时、网络错误）"""
+    if isinstance(error, TimedOut):
+        return True
+    # BadRequest 也是 NetworkError 的子类，但属于永久错误
+    return isinstance(error, NetworkError) and not isinstance(error, BadRequest)
+
+
+def is_unreachable(error: Exception) -> bool:
+    """判断发送错误是否说明该用户永久无法接收消息（屏蔽了 Bot、账号已注销、聊天不存在）"""
+    if isinstance(error, Forbidden):
+        return True
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        return any(marker in message for marker in RECIPIENT_ERROR_MARKERS)
+    return False
+
+
+def is_message_gone(error: Exception) -> bool:
+    """判断删除消息时的错误是否说明消息已经不存在"""
+    return isinstance(error, BadRequest) and "message to delete not found" in str(error).lower()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import random
+import time
+import weakref
+from app.bot.config import PUSH_CONCURRENCY, PUSH_MAX_RETRIES
+from app.services.errors import get_retry_after, is_transient
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# 正在运行的扇出引擎，抓取指标时读取队列深度和并发数
+_running = weakref.WeakSet()
+
+
+def _sum_by_name(value):
+    totals = {}
+    for fan_out in list(_running):
+        totals[(fan_out.name,)] = totals.get((fan_out.name,), 0) + value(fan_out)
+    return totals
+
+
+metrics.Gauge("fanout_queue_depth", "扇出队列中等待处理的任务数", ["fanout"],
+              function=lambda: _sum_by_name(lambda fan_out: fan_out.queue_depth))
+metrics.Gauge("fanout_in_flight", "正在处理的任务数", ["fanout"],
+              function=lambda: _sum_by_name(lambda fan_out: fan_out.in_flight))
+
+
+class FanOut:
+    """并发扇出引擎
+
+    生产者把任务放入有界队列，固定数量的工作协程取出任务，
+    经过限流器后调用 handler 处理。队列满时生产者会等待，内存占用保持恒定。
+
+    handler 抛出限流（RetryAfter）或临时网络错误时，任务在等待后重新入队，
+    限流错误还会暂停全局发送并调用 on_throttle(retry_after)；
+    其他错误或重试次数用尽时调用 on_failure(item, error)。
+    name 用于区分指标，如 send、delete；lane 和 priority 传给限流器，
+    同一进程中同时运行的扇出按优先级权重分享全局配额。
+    """
+
+    def __init__(self, handler, limiter, key=None, concurrency: int = PUSH_CONCURRENCY,
+                 queue_size: int = None, on_failure=None, max_retries: int = PUSH_MAX_RETRIES,
+                 on_throttle=None, name: str = "default", lane=None, priority: str = None):
+        self.handler = handler
+        self.limiter = limiter
+        self.key = key
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size or self.concurrency * 4
+        self.on_failure = on_failure
+        self.max_retries = max_retries
+        self.on_throttle = on_throttle
+        self.name = name
+        self.lane = lane
+        self.priority = priority
+        self.in_flight = 0
+        self._queue = None
+        self._retries = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def run(self, items):
+        """处理 items（同步或异步可迭代对象）中的所有任务，全部完成后返回"""
+        queue = self._queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        _running.add(self)
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await queue.put((item, 0))
+            else:
+                for item in items:
+                    await queue.put((item, 0))
+            await queue.join()
+        finally:
+            _running.discard(self)
+            retries = list(self._retries)
+            for task in workers + retries:
+                task.cancel()
+            await asyncio.gather(*workers, *retries, return_exceptions=True)
+
+    async def _worker(self, queue: asyncio.Queue):
+        """工作协程：限流后处理任务，可重试的错误重新入队"""
+        while True:
+            item, attempt = await queue.get()
+            try:
+                await self.limiter.acquire(self.key(item) if self.key else None, self.lane, self.priority)
+                started = time.monotonic()
+                self.in_flight += 1
+                try:
+                    await self.handler(item)
+                finally:
+                    self.in_flight -= 1
+                self.limiter.record_success(time.monotonic() - started)
+            except Exception as e:
+                metrics.FANOUT_ERRORS.inc(self.name, type(e).__name__)
+                delay = self._retry_delay(e, attempt)
+                if delay is not None:
+                    # 原任务在重新入队后才标记完成，保证 queue.join() 不会提前返回
+                    task = asyncio.create_task(self._requeue(queue, item, attempt + 1, delay))
+                    self._retries.add(task)
+                    task.add_done_callback(self._retries.discard)
+                    continue
+                self._fail(item, e)
+            queue.task_done()
+
+    def _retry_delay(self, error: Exception, attempt: int):
+        """返回重试前的等待秒数，不应重试时返回 None"""
+        if attempt >= self.max_retries:
+            return None
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            self.limiter.pause(retry_after)
+            metrics.RETRY_AFTER.inc(self.name)
+            metrics.RETRY_AFTER_SECONDS.inc(self.name, amount=retry_after)
+            if self.on_throttle is not None:
+                self.on_throttle(retry_after)
+            return retry_after + random.uniform(0, 1)
+        if is_transient(error):
+            # 指数退避并加入随机抖动，避免同时重试
+            return min(2 ** attempt, 30) * random.uniform(0.5, 1.5)
+        return None
+
+    async def _requeue(self, queue: asyncio.Queue, item, attempt: int, delay: float):
+        """等待 delay 秒后把任务重新放回队列"""
+        try:
+            await asyncio.sleep(delay)
+            await queue.put((item, attempt))
+        finally:
+            queue.task_done()
+
+    def _fail(self, item, error: Exception):
+        """任务最终失败"""
+        if self.on_failure is None:
+            logger.error(f"处理任务失败: {error}")
+            return
+        try:
+            self.on_failure(item, error)
+        except Exception as e:
+            logger.error(f"记录任务失败时出错: {e}")
+
+
+async def run_all(runs):
+    """并行运行多个扇出引擎，runs 为 [(扇出引擎, 任务), ...]，全部完成后返回
+
+    任一引擎出错时取消其余引擎并抛出该错误。
+    """
+    tasks = [asyncio.create_task(fan_out.run(items)) for fan_out, items in runs]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
\ No newline at end of file
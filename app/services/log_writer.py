@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from app.db.session import SessionLocal
+from app.crud import logs as logs_crud
+from app.crud import users as users_crud
+from app.bot.config import LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    """缓冲的日志写入器
+
+    发送协程只把日志行放入缓冲区，达到 max_rows 条或每隔 flush_interval 秒
+    批量写入一次；退出 async with 时（无论成功或异常）写入剩余的日志。
+    写入失败时日志放回缓冲区，下次写入时重试，不会丢失已发送消息的日志。
+    使用独立的数据库会话，提交不会使推送会话中的对象过期。
+    """
+
+    # 指标中的写入类型
+    kind = "logs"
+    # 写入持续失败时缓冲区最多保留 max_rows 的多少倍，超过后丢弃最早的行
+    MAX_PENDING_BATCHES = 20
+    # 退出时写入剩余数据的尝试次数
+    FINAL_FLUSH_ATTEMPTS = 3
+
+    def __init__(self, max_rows: int = LOG_FLUSH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._failing = False
+        self._db = None
+        self._task = None
+
+    async def __aenter__(self):
+        self._db = SessionLocal()
+        self._task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            for attempt in range(self.FINAL_FLUSH_ATTEMPTS):
+                if self.flush():
+                    break
+                if attempt < self.FINAL_FLUSH_ATTEMPTS - 1:
+                    await asyncio.sleep(self.flush_interval)
+            else:
+                logger.error(f"最后一次批量写入失败（{self.kind}），丢弃 {len(self._buffer)} 条")
+        finally:
+            self._db.close()
+
+    def add(self, log_data: dict):
+        """添加一条日志，缓冲区满时立即写入；写入失败后等待定时写入重试"""
+        self._buffer.append(log_data)
+        if len(self._buffer) >= self.max_rows and not self._failing:
+            self.flush()
+
+    def flush(self) -> bool:
+        """把缓冲区中的日志批量写入数据库，失败时放回缓冲区等待重试，返回是否写入成功"""
+        if not self._buffer:
+            return True
+        rows, self._buffer = self._buffer, []
+        started = time.monotonic()
+        try:
+            self._write(rows)
+            metrics.DB_FLUSH_LATENCY.observe(time.monotonic() - started, self.kind)
+            metrics.DB_FLUSH_ROWS.inc(self.kind, amount=len(rows))
+            self._failing = False
+            return True
+        except Exception as e:
+            self._db.rollback()
+            self._failing = True
+            self._buffer = rows + self._buffer
+            limit = self.max_rows * self.MAX_PENDING_BATCHES
+            if len(self._buffer) > limit:
+                dropped = len(self._buffer) - limit
+                self._buffer = self._buffer[dropped:]
+                logger.error(f"批量写入持续失败（{self.kind}），缓冲区已满，丢弃最早的 {dropped} 条: {e}")
+            else:
+                logger.warning(f"批量写入失败（{self.kind}），{len(rows)} 条稍后重试: {e}")
+            return False
+
+    def _write(self, rows: list):
+        logs_crud.bulk_create_logs(self._db, rows)
+
+    async def _flush_periodically(self):
+        """定时写入，保证低速发送时日志也能及时落库"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+class UserDeactivator(LogWriter):
+    """缓冲的用户停用：add(user_id) 后批量执行 UPDATE users SET is_active = false"""
+
+    kind = "deactivated_users"
+
+    def _write(self, rows: list):
+        deactivated = users_crud.deactivate_users(self._db, rows)
+        logger.info(f"停用了 {deactivated} 个无法送达的用户")
+
+
+class DeletedLogMarker(LogWriter):
+    """缓冲的撤回标记：add(log_id) 后批量执行 UPDATE logs SET deleted_at"""
+
+    kind = "deleted_logs"
+
+    def _write(self, rows: list):
+        logs_crud.mark_logs_deleted(self._db, rows)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from app.crud import pushs as pushs_crud
+from app.services.errors import is_media_error
+
+logger = logging.getLogger(__name__)
+
+
+class MediaUnavailableError(Exception):
+    """该推送的媒体已确认无法发送"""
+
+
+def _extract_file_id(message, field: str):
+    """从发送结果中取出媒体的 file_id"""
+    attachment = getattr(message, field, None)
+    # 图片返回多个尺寸，取最大的一个
+    if isinstance(attachment, (list, tuple)):
+        attachment = attachment[-1] if attachment else None
+    return attachment.file_id if attachment else None
+
+
+class MediaResolver:
+    """每个推送只解析一次媒体
+
+    第一次发送使用 media_url，成功后记录 Telegram 返回的 file_id 并保存到推送，
+    之后的接收者都直接使用 file_id。解析期间其他发送协程等待结果，避免重复拉取 URL；
+    如果媒体本身不可用，记录失败，后续接收者直接发送文本。
+    保存的 file_id 失效时清除它并重新从 media_url 解析，media_url 也无法发送时才记录失败。
+
+    file_id 只对上传它的 Bot 有效，推送中只保存第一个 Bot 的 file_id；
+    Bot 池中其他 Bot 使用 persist=False，每次发送时各自上传一次。
+    """
+
+    def __init__(self, db, push, field: str, persist: bool = True):
+        self.db = db
+        self.push_id = push.push_id
+        self.media_url = push.media_url
+        self.field = field
+        self.persist = persist
+        self.file_id = getattr(push, "media_file_id", None) if persist else None
+        self.resolved = bool(self.file_id)
+        self.failed = False
+        self._lock = asyncio.Lock()
+
+    async def send(self, send_media):
+        """调用 send_media(media) 发送，media 为 file_id 或 URL"""
+        if self.resolved:
+            file_id = self.file_id
+            try:
+                return await send_media(file_id or self.media_url)
+            except Exception as e:
+                if not (file_id and is_media_error(e)):
+                    raise
+                self._discard_file_id(file_id, e)
+
+        async with self._lock:
+            # 等待期间可能已由其他协程完成解析
+            if self.resolved:
+                return await send_media(self.file_id or self.media_url)
+            if self.failed:
+                raise MediaUnavailableError(self.media_url)
+
+            try:
+                message = await send_media(self.media_url)
+            except Exception as e:
+                if is_media_error(e):
+                    self.failed = True
+                    logger.error(f"推送 {self.push_id} 的媒体无法发送，后续改为发送文本: {e}")
+                raise
+
+            self.file_id = _extract_file_id(message, self.field)
+            self.resolved = True
+            if self.file_id and self.persist:
+                pushs_crud.set_media_file_id(self.db, self.push_id, self.file_id)
+                logger.info(f"推送 {self.push_id} 的媒体已上传，file_id: {self.file_id}")
+            return message
+
+    def _discard_file_id(self, file_id: str, error: Exception):
+        """清除失效的 file_id，下一次发送重新从 media_url 解析"""
+        # 其他协程可能已经清除或重新解析
+        if self.file_id != file_id:
+            return
+        logger.warning(f"推送 {self.push_id} 的媒体 file_id 已失效，重新从 URL 上传: {error}")
+        self.file_id = None
+        self.resolved = False
+        if self.persist:
+            pushs_crud.set_media_file_id(self.db, self.push_id, None)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from app.db.session import SessionLocal
+from app.crud import pushs as pushs_crud
+from app.bot.config import PROGRESS_STREAM_INTERVAL, PROGRESS_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class PushProgress:
+    """正在本进程中发送的推送的内存进度，发送协程只做计数，不访问数据库"""
+
+    def __init__(self, hub, push_id: int, total: int, sent: int = 0, failed: int = 0):
+        self.hub = hub
+        self.push_id = push_id
+        self.total = total
+        # 续发时之前已经记录的数量
+        self.base_sent = sent
+        self.base_failed = failed
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.started = time.monotonic()
+
+    def add(self, sent: int = 0, failed: int = 0):
+        self.sent += sent
+        self.failed += failed
+        self.hub.notify(self.push_id)
+
+    def throttle(self, retry_after: float = None):
+        """记录一次 Telegram 限流（RetryAfter）"""
+        self.throttled += 1
+        self.hub.notify(self.push_id)
+
+    def snapshot(self) -> dict:
+        done = self.sent + self.failed
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.base_sent - self.base_failed - done, 0)
+        return {
+            "push_id": self.push_id,
+            "status": "sending",
+            "total": self.total,
+            "sent": self.base_sent + self.sent,
+            "failed": self.base_failed + self.failed,
+            "throttled": self.throttled,
+            "rate": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+        }
+
+
+class ProgressHub:
+    """推送进度广播
+
+    本进程中正在发送的推送直接从内存计数生成进度，每个订阅者最多每 interval 秒收到一次更新，
+    订阅者数量不影响数据库负载。推送在其他进程（独立 worker 或分区）中发送时，
+    同一推送的所有订阅者共享一次每 poll_interval 秒的数据库读取。
+    """
+
+    def __init__(self, interval: float = PROGRESS_STREAM_INTERVAL, poll_interval: float = PROGRESS_POLL_INTERVAL):
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self._active = {}
+        self._subscribers = {}
+        self._polls = {}
+
+    def start(self, push_id: int, total: int, sent: int = 0, failed: int = 0) -> PushProgress:
+        """开始跟踪本进程中发送的推送"""
+        progress = PushProgress(self, push_id, total, sent, failed)
+        self._active[push_id] = progress
+        self.notify(push_id)
+        return progress
+
+    def finish(self, push_id: int):
+        """推送发送结束，订阅者随后从数据库读取最终状态"""
+        self._active.pop(push_id, None)
+        self._polls.pop(push_id, None)
+        self.notify(push_id)
+
+    def notify(self, push_id: int):
+        """唤醒该推送的订阅者"""
+        for event in self._subscribers.get(push_id, ()):
+            event.set()
+
+    async def subscribe(self, push_id: int):
+        """异步生成推送进度快照，推送不再发送时生成最后一次快照后结束"""
+        event = asyncio.Event()
+        self._subscribers.setdefault(push_id, set()).add(event)
+        try:
+            while True:
+                snapshot = await self._snapshot(push_id)
+                yield snapshot
+                if snapshot is None or snapshot["status"] != "sending":
+                    return
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                # 合并频繁的计数更新
+                await asyncio.sleep(self.interval)
+        finally:
+            subscribers = self._subscribers.get(push_id)
+            subscribers.discard(event)
+            if not subscribers:
+                self._subscribers.pop(push_id, None)
+                self._polls.pop(push_id, None)
+
+    async def _snapshot(self, push_id: int):
+        progress = self._active.get(push_id)
+        if progress is not None:
+            return progress.snapshot()
+
+        # 同一推送的订阅者在 poll_interval 内共享同一次数据库读取
+        now = time.monotonic()
+        poll = self._polls.get(push_id)
+        if poll is None or now - poll[0] >= self.poll_interval:
+            poll = (now, asyncio.ensure_future(asyncio.to_thread(self._read_push, push_id)))
+            self._polls[push_id] = poll
+        return await asyncio.shield(poll[1])
+
+    @staticmethod
+    def _read_push(push_id: int):
+        db = SessionLocal()
+        try:
+            push = pushs_crud.get_push(db, push_id)
+            if push is None:
+                return None
+            return {
+                "push_id": push.push_id,
+                "status": push.status,
+                "total": push.target_user_count,
+                "sent": push.sent_count,
+                "failed": push.failed_count,
+                "throttled": None,
+                "rate": None,
+                "eta_seconds": None,
+            }
+        finally:
+            db.close()
+
+
+progress_hub = ProgressHub()
\ No newline at end of file
@@ -1,13 +1,24 @@
-import asyncio
-import json
 import logging
+import time
+from functools import partial
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.db.session import SessionLocal
 from app.crud import pushs as pushs_crud
-from app.crud import users as users_crud
 from app.crud import logs as logs_crud
-from app.bot.config import BOT_TOKEN
+from app.crud import partitions as partitions_crud
+from app.bot.client import get_bots
+from app.bot.config import PUSH_PARTITION_SIZE
+from app.services.rate_limiter import get_rate_limiter
+from app.services.fan_out import FanOut, run_all
+from app.services.log_writer import LogWriter, DeletedLogMarker, UserDeactivator
+from app.services.counters import PushCounters
+from app.services.media import MediaResolver
+from app.services.push_template import compile_push
+from app.services import audience as audience_service
+from app.services.progress import progress_hub
+from app.services.errors import is_message_gone, is_unreachable
+from app.core import metrics
 
 # 配置日志
 logging.basicConfig(
@@ -17,18 +28,147 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def escape_markdown(text):
-    """转义 Markdown 特殊字符"""
-    if not text:
-        return ""
-    escape_chars = r'_*[]()~`>#+-=|{}.!'
-    return ''.join([f'\\{char}' if char in escape_chars else char for char in text])
+async def _send_content(bot, compiled, chat_id, text, media=None):
+    """按编译好的发送方法发送消息，返回消息ID。媒体无法发送时退回为文本消息"""
+    if not compiled.is_media:
+        result = await bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=compiled.parse_mode,
+            reply_markup=compiled.keyboard
+        )
+        return result.message_id
 
-
-async def send_push(push_id: int):
-    """发送推送消息的异步任务"""
+    if not media.failed:
+        try:
+            result = await media.send(lambda value: getattr(bot, compiled.send_method)(
+                chat_id=chat_id,
+                caption=text,
+                parse_mode=compiled.parse_mode,
+                reply_markup=compiled.keyboard,
+                **{compiled.media_field: value}
+            ))
+            return result.message_id
+        except Exception as e:
+            # 只有媒体本身不可用时才退回文本，其他错误（如用户屏蔽）直接上报
+            if not media.failed:
+                raise
+            logger.debug(f"发送{compiled.media_label}失败: {e}")
+
+    result = await bot.send_message(
+        chat_id=chat_id,
+        text=compiled.fallback_text(text),
+        parse_mode=compiled.parse_mode,
+        reply_markup=compiled.keyboard
+    )
+    return result.message_id
+
+
+async def _deliver(db: Session, push, lo_user_id: int = None, hi_user_id: int = None, progress: dict = None,
+                   tracker=None):
+    """向推送受众中用户ID在 [lo_user_id, hi_user_id) 内的用户发送推送，返回 (成功数, 失败数)
+
+    progress 不为空时实时累加 sent/failed，供分区续约时上报进度；
+    tracker 为 progress_hub 中的内存进度，供进度推送接口使用。
+    Bot 池中的每个 Bot 分别读取分配给自己的用户，使用各自的限流器并行发送。
+    """
+    push_id = push.push_id
+
+    # 编译推送：键盘、发送方法和内容模板只构建一次
+    compiled = compile_push(push)
+
+    # 使用进程内共享的 Bot 池
+    bots = get_bots()
+
+    # 媒体只在每个 Bot 第一次发送时上传，之后复用 file_id
+    media = [None] * len(bots)
+    if compiled.is_media:
+        media = [MediaResolver(db, push, compiled.media_field, persist=index == 0) for index in range(len(bots))]
+
+    # 发送消息计数
+    success_count = 0
+    fail_count = 0
+
+    async def deliver(bot, bot_index, media, user):
+        """向单个用户发送消息并记录结果，失败时抛出异常由扇出引擎决定是否重试"""
+        nonlocal success_count
+        started = time.monotonic()
+        message_id = await _send_content(bot, compiled, user.telegram_id, compiled.render(user), media)
+        metrics.SEND_LATENCY.observe(time.monotonic() - started, compiled.content_type)
+        metrics.SENDS.inc(compiled.content_type)
+
+        # 记录发送成功
+        log_writer.add({
+            "push_id": push_id,
+            "user_id": user.user_id,
+            "status": "sent",
+            "sent_at": datetime.now(),
+            "message_id": message_id,  # 保存消息ID
+            "bot_index": bot_index  # 撤回时由发送它的 Bot 删除
+        })
+
+        # 更新发送计数（内存累加，定时批量写入）
+        counters.add(push_id, sent=1)
+        success_count += 1
+        if progress is not None:
+            progress["sent"] += 1
+        if tracker is not None:
+            tracker.add(sent=1)
+
+    def record_failure(bot_index, user, e):
+        """记录最终发送失败（不可重试或重试次数用尽）"""
+        nonlocal fail_count
+        logger.error(f"发送消息失败: {e}")
+        metrics.SEND_FAILURES.inc(compiled.content_type, type(e).__name__)
+        # 屏蔽了 Bot 或已注销的用户批量停用，之后的推送不再发送给他们
+        if is_unreachable(e):
+            deactivator.add(user.user_id)
+        log_writer.add({
+            "push_id": push_id,
+            "user_id": user.user_id,
+            "status": "failed",
+            "error_message": str(e),
+            "bot_index": bot_index
+        })
+        counters.add(push_id, failed=1)
+        fail_count += 1
+        if progress is not None:
+            progress["failed"] += 1
+        if tracker is not None:
+            tracker.add(failed=1)
+
+    # 每个 Bot 并发发送，由它的限流器控制全局和单聊天的发送速率，同时发送的推送按优先级分享全局配额；
+    # 日志、计数和用户停用缓冲后批量写入
+    async with LogWriter() as log_writer, PushCounters() as counters, UserDeactivator() as deactivator:
+        runs = []
+        for index, bot in enumerate(bots):
+            fan_out = FanOut(partial(deliver, bot, index, media[index]), get_rate_limiter(index),
+                             key=lambda user: user.telegram_id, on_failure=partial(record_failure, index),
+                             on_throttle=tracker.throttle if tracker else None,
+                             name="send", lane=push_id, priority=push.priority)
+            # 发送时在服务端解析受众，分批流式获取活跃用户，由发送队列控制读取进度；
+            # 跳过已发送成功的用户，中断后重新发送时从未完成的部分继续
+            recipients = audience_service.iter_recipients(
+                db, push, lo_user_id, hi_user_id, skip_sent_push_id=push_id, fields=compiled.fields,
+                bot_index=index if len(bots) > 1 else None
+            )
+            runs.append((fan_out, recipients))
+        await run_all(runs)
+
+    return success_count, fail_count
+
+
+async def send_push(push_id: int, token: str = None):
+    """发送推送消息的异步任务
+
+    token 为领取推送时生成的所有者令牌，推送已被其他发送领取（令牌不一致）时直接跳过，
+    同一推送同时只有一次发送。
+    受众人数超过 PUSH_PARTITION_SIZE 时只把推送切分为分区写入数据库，
+    由各个 worker 领取分区并行发送，最后一个分区结束时推送标记为完成。
+    """
     # 创建一个新的数据库会话
     db = SessionLocal()
+    tracker = None
     try:
         logger.info(f"开始发送推送 ID: {push_id}")
         # 获取推送信息
@@ -36,316 +176,65 @@ async def send_push(push_id: int):
         if not push:
             logger.error(f"推送不存在: {push_id}")
             return
-
-        # 解析目标用户ID
-        target_user_ids = []
-        if isinstance(push.target_user_ids, str):
-            try:
-                target_user_ids = json.loads(push.target_user_ids)
-                logger.info(f"目标用户数量: {len(target_user_ids)}")
-            except json.JSONDecodeError:
-                logger.error(f"解析目标用户ID失败: {push.target_user_ids}")
-                pushs_crud.update_push_status(db, push_id, "cancelled")
-                return
-        else:
-            target_user_ids = push.target_user_ids
-
-        # 获取目标用户
-        users = []
-        for user_id in target_user_ids:
-            user = users_crud.get_user(db, user_id)
-            if user and user.is_active:
-                users.append(user)
-
-        logger.info(f"找到活跃用户数量: {len(users)}")
-
-        # 导入Telegram库
-        try:
-            from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-        except ImportError:
-            logger.error("无法导入telegram库，请确保已安装 python-telegram-bot")
-            pushs_crud.update_push_status(db, push_id, "cancelled")
+        if push.status != "sending" or (token is not None and push.send_token != token):
+            logger.warning(f"推送 {push_id} 已由其他发送领取或不在发送中（{push.status}），跳过")
             return
 
-        # 解析按钮数据
-        keyboard = None
-        if hasattr(push, 'buttons') and push.buttons:
-            try:
-                logger.info(f"处理按钮数据: {push.buttons}")
-                if isinstance(push.buttons, str):
-                    buttons_data = json.loads(push.buttons)
-                else:
-                    buttons_data = push.buttons
-
-                logger.info(f"解析后的按钮数据: {buttons_data}")
-
-                # 构建按钮键盘
-                keyboard_buttons = []
-                for btn in buttons_data:
-                    row = []
-                    if 'text' not in btn or not btn['text']:
-                        logger.warning(f"按钮缺少文本: {btn}")
-                        continue
-
-                    if 'url' in btn and btn['url']:
-                        logger.info(f"添加URL按钮: {btn['text']} -> {btn['url']}")
-                        row.append(InlineKeyboardButton(text=btn['text'], url=btn['url']))
-                    elif 'callback_data' in btn and btn['callback_data']:
-                        logger.info(f"添加回调按钮: {btn['text']} -> {btn['callback_data']}")
-                        row.append(InlineKeyboardButton(text=btn['text'], callback_data=btn['callback_data']))
-
-                    if row:
-                        keyboard_buttons.append(row)
-
-                if keyboard_buttons:
-                    keyboard = InlineKeyboardMarkup(keyboard_buttons)
-                    logger.info(f"创建了带有 {len(keyboard_buttons)} 行按钮的键盘")
-                else:
-                    logger.warning("未能创建有效的按钮键盘")
-            except Exception as e:
-                logger.error(f"解析按钮数据失败: {e}")
+        # 统计受众人数
+        audience = audience_service.get_audience(push)
+        recipient_count = audience_service.count_recipients(db, push)
+        logger.info(f"受众类型: {audience['type']}，目标用户数量: {recipient_count}")
 
-        # 创建Bot实例
-        bot = Bot(token=BOT_TOKEN)
-
-        # 发送消息计数
-        success_count = 0
-        fail_count = 0
-
-        # 发送消息
-        for user in users:
-            try:
-                logger.info(f"向用户 {user.telegram_id} 发送 {push.content_type} 类型消息")
-
-                # 使用Markdown (如果启用)
-                parse_mode = None
-                if hasattr(push, 'use_markdown') and push.use_markdown:
-                    parse_mode = "MarkdownV2"
-                    logger.info(f"使用 MarkdownV2 格式")
-
-                # 根据内容类型发送不同类型的消息
-                if push.content_type == "text":
-                    result = await bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=push.content,
-                        parse_mode=parse_mode,
-                        reply_markup=keyboard
-                    )
-
-                    # 记录消息ID
-                    message_id = result.message_id
-
-                    # 记录发送成功
-                    logs_crud.create_log(db, {
-                        "push_id": push.push_id,
-                        "user_id": user.user_id,
-                        "status": "sent",
-                        "sent_at": datetime.now(),
-                        "message_id": message_id  # 保存消息ID
-                    })
-
-                elif push.content_type == "photo":
-                    try:
-                        result = await bot.send_photo(
-                            chat_id=user.telegram_id,
-                            photo=push.media_url,
-                            caption=push.content,
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                    except Exception as e:
-                        logger.error(f"发送图片失败: {e}")
-                        result = await bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=f"[图片] {push.content}\n{push.media_url}",
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                elif push.content_type == "video":
-                    try:
-                        result = await bot.send_video(
-                            chat_id=user.telegram_id,
-                            video=push.media_url,
-                            caption=push.content,
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                    except Exception as e:
-                        logger.error(f"发送视频失败: {e}")
-                        result = await bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=f"[视频] {push.content}\n{push.media_url}",
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                elif push.content_type == "document":
-                    try:
-                        result = await bot.send_document(
-                            chat_id=user.telegram_id,
-                            document=push.media_url,
-                            caption=push.content,
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                    except Exception as e:
-                        logger.error(f"发送文档失败: {e}")
-                        result = await bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=f"[文档] {push.content}\n{push.media_url}",
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                elif push.content_type == "audio":
-                    try:
-                        result = await bot.send_audio(
-                            chat_id=user.telegram_id,
-                            audio=push.media_url,
-                            caption=push.content,
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                    except Exception as e:
-                        logger.error(f"发送音频失败: {e}")
-                        result = await bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=f"[音频] {push.content}\n{push.media_url}",
-                            parse_mode=parse_mode,
-                            reply_markup=keyboard
-                        )
-
-                        # 记录消息ID
-                        message_id = result.message_id
-
-                        # 记录发送成功
-                        logs_crud.create_log(db, {
-                            "push_id": push.push_id,
-                            "user_id": user.user_id,
-                            "status": "sent",
-                            "sent_at": datetime.now(),
-                            "message_id": message_id
-                        })
-
-                # 更新发送计数
-                pushs_crud.increment_sent_count(db, push_id)
-                success_count += 1
-
-                # 避免发送太快触发限制
-                await asyncio.sleep(0.1)
+        # 大推送分片发送
+        if recipient_count > PUSH_PARTITION_SIZE:
+            bounds = audience_service.split_partitions(db, push, PUSH_PARTITION_SIZE)
+            count = partitions_crud.create_partitions(db, push_id, bounds)
+            logger.info(f"推送 {push_id} 已切分为 {count} 个分区，等待 worker 领取")
+            return
 
-            except Exception as e:
-                logger.error(f"发送消息失败: {e}")
-                logs_crud.create_log(db, {
-                    "push_id": push.push_id,
-                    "user_id": user.user_id,
-                    "status": "failed",
-                    "error_message": str(e)
-                })
-                fail_count += 1
+        tracker = progress_hub.start(push_id, recipient_count, push.sent_count or 0, push.failed_count or 0)
+        success_count, fail_count = await _deliver(db, push, tracker=tracker)
 
         # 更新推送状态
-        pushs_crud.update_push_status(db, push_id, "completed")
+        pushs_crud.release_push(db, push_id, token, "completed")
         logger.info(f"推送 {push_id} 发送完成。成功: {success_count}, 失败: {fail_count}")
 
     except Exception as e:
         logger.error(f"发送推送时出错: {e}")
-        pushs_crud.update_push_status(db, push_id, "cancelled")
+        pushs_crud.release_push(db, push_id, token, "cancelled")
+    finally:
+        if tracker is not None:
+            progress_hub.finish(push_id)
+        db.close()
+
+
+async def send_partition(push_id: int, lo_user_id: int, hi_user_id: int, progress: dict):
+    """发送推送的一个分区（受众中用户ID在 [lo_user_id, hi_user_id) 内的用户）
+
+    出错时抛出异常，由 worker 记录分区失败或释放租约。
+    """
+    db = SessionLocal()
+    try:
+        push = pushs_crud.get_push(db, push_id)
+        if not push:
+            raise ValueError(f"推送不存在: {push_id}")
+        if push.status != "sending":
+            logger.info(f"推送 {push_id} 状态为 {push.status}，跳过分区")
+            return
+
+        logger.info(f"开始发送推送 {push_id} 分区 [{lo_user_id}, {hi_user_id})")
+        success_count, fail_count = await _deliver(db, push, lo_user_id, hi_user_id, progress)
+        logger.info(f"推送 {push_id} 分区 [{lo_user_id}, {hi_user_id}) 完成。成功: {success_count}, 失败: {fail_count}")
     finally:
         db.close()
 
 
 async def delete_sent_message(push_id: int):
-    """删除已发送的推送消息"""
+    """撤回已发送的推送消息
+
+    一次关联查询流式读取 (log_id, message_id, telegram_id)，通过与发送相同的限流扇出引擎并发删除，
+    删除成功的日志批量标记 deleted_at，重试时会跳过已撤回的消息。
+    """
     # 创建一个新的数据库会话
     db = SessionLocal()
     try:
@@ -356,59 +245,44 @@ async def delete_sent_message(push_id: int):
             logger.error(f"推送不存在: {push_id}")
             return {"success": False, "error": "推送不存在"}
 
-        # 获取该推送的所有成功发送日志
-        logs = logs_crud.get_logs(db, push_id=push_id, status="sent")
-        if not logs:
-            logger.warning(f"未找到推送 {push_id} 的发送记录")
-            return {"success": False, "error": "未找到发送记录"}
-
-        logger.info(f"找到 {len(logs)} 条发送记录")
-
-        # 导入Telegram库
-        try:
-            from telegram import Bot
-        except ImportError:
-            logger.error("无法导入telegram库")
-            return {"success": False, "error": "无法导入telegram库"}
-
-        # 创建Bot实例
-        bot = Bot(token=BOT_TOKEN)
+        # 使用进程内共享的 Bot 池，消息由发送它的 Bot 删除
+        bots = get_bots()
 
         # 删除消息计数
         success_count = 0
         fail_count = 0
 
-        # 尝试删除每条消息
-        for log in logs:
+        async def delete(bot, message):
+            """删除单条消息，失败时抛出异常由扇出引擎决定是否重试"""
+            nonlocal success_count
             try:
-                # 检查是否有消息ID
-                if not log.message_id:
-                    logger.warning(f"日志 {log.log_id} 没有消息ID")
-                    fail_count += 1
-                    continue
-
-                # 获取用户信息
-                user = users_crud.get_user(db, log.user_id)
-                if not user:
-                    logger.warning(f"找不到用户ID {log.user_id}")
-                    fail_count += 1
-                    continue
-
-                logger.info(f"尝试删除用户 {user.telegram_id} 的消息 {log.message_id}")
-
-                # 删除消息
-                await bot.delete_message(
-                    chat_id=user.telegram_id,
-                    message_id=log.message_id
-                )
-
-                logger.info(f"成功删除消息 {log.message_id}")
-                success_count += 1
-
+                await bot.delete_message(chat_id=message.telegram_id, message_id=message.message_id)
             except Exception as e:
-                logger.error(f"删除消息失败: {e}")
-                fail_count += 1
+                # 消息已经不存在（如用户已删除），同样视为撤回完成
+                if not is_message_gone(e):
+                    raise
+            marker.add(message.log_id)
+            success_count += 1
+
+        def record_failure(message, e):
+            """记录删除失败，该日志保持未撤回状态，可以再次执行"""
+            nonlocal fail_count
+            logger.error(f"删除消息 {message.message_id} 失败: {e}")
+            fail_count += 1
+
+        async with DeletedLogMarker() as marker:
+            runs = []
+            for index, bot in enumerate(bots):
+                fan_out = FanOut(partial(delete, bot), get_rate_limiter(index),
+                                 key=lambda message: message.telegram_id, on_failure=record_failure,
+                                 name="delete", lane=("delete", push_id), priority=push.priority)
+                messages = logs_crud.iter_deletable_messages(
+                    db, push_id, bot_index=index if len(bots) > 1 else None
+                )
+                runs.append((fan_out, messages))
+            await run_all(runs)
 
+        logger.info(f"推送 {push_id} 消息删除完成。成功: {success_count}, 失败: {fail_count}")
         return {
             "success": True,
             "deleted_count": success_count,
@@ -0,0 +1,112 @@
+import json
+import logging
+import re
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# 媒体类型 -> (发送方法, 参数名, 显示名称)
+MEDIA_SENDERS = {
+    "photo": ("send_photo", "photo", "图片"),
+    "video": ("send_video", "video", "视频"),
+    "document": ("send_document", "document", "文档"),
+    "audio": ("send_audio", "audio", "音频"),
+}
+
+# 可在推送内容中使用的个性化字段，如 "你好，{first_name}"
+PERSONAL_FIELDS = ("first_name", "last_name", "username")
+
+# 只匹配已知字段，内容中其他花括号（如 MarkdownV2 转义的 \{）保持原样
+PLACEHOLDER_PATTERN = re.compile(r"(?<!\\)\{(" + "|".join(PERSONAL_FIELDS) + r")\}")
+
+
+def escape_markdown(text):
+    """转义 Markdown 特殊字符"""
+    if not text:
+        return ""
+    # 反斜杠本身也需要转义；逐字符处理，已转义的字符不会被再次转义
+    escape_chars = '\\' + r'_*[]()~`>#+-=|{}.!'
+    return ''.join([f'\\{char}' if char in escape_chars else char for char in text])
+
+
+def build_keyboard(buttons):
+    """把按钮 JSON 解析为 InlineKeyboardMarkup，无有效按钮时返回 None"""
+    if not buttons:
+        return None
+    try:
+        buttons_data = json.loads(buttons) if isinstance(buttons, str) else buttons
+
+        # 构建按钮键盘
+        keyboard_buttons = []
+        for btn in buttons_data:
+            if 'text' not in btn or not btn['text']:
+                logger.warning(f"按钮缺少文本: {btn}")
+                continue
+
+            if 'url' in btn and btn['url']:
+                keyboard_buttons.append([InlineKeyboardButton(text=btn['text'], url=btn['url'])])
+            elif 'callback_data' in btn and btn['callback_data']:
+                keyboard_buttons.append([InlineKeyboardButton(text=btn['text'], callback_data=btn['callback_data'])])
+
+        if keyboard_buttons:
+            logger.info(f"创建了带有 {len(keyboard_buttons)} 行按钮的键盘")
+            return InlineKeyboardMarkup(keyboard_buttons)
+        logger.warning("未能创建有效的按钮键盘")
+    except Exception as e:
+        logger.error(f"解析按钮数据失败: {e}")
+    return None
+
+
+class CompiledPush:
+    """编译后的推送
+
+    按钮键盘、发送方法、parse_mode 和内容模板在发送前只计算一次，
+    每个接收者只需要把个性化字段填入模板。
+    """
+
+    def __init__(self, push):
+        self.push_id = push.push_id
+        self.content_type = push.content_type
+        self.media_url = push.media_url
+        self.parse_mode = "MarkdownV2" if getattr(push, 'use_markdown', False) else None
+        self.keyboard = build_keyboard(getattr(push, 'buttons', None))
+
+        media = MEDIA_SENDERS.get(push.content_type)
+        if media:
+            self.send_method, self.media_field, self.media_label = media
+        else:
+            self.send_method, self.media_field, self.media_label = "send_message", None, None
+
+        # 把内容拆分为 [文本, 字段, 文本, 字段, ..., 文本]，奇数位置为字段名
+        self._parts = PLACEHOLDER_PATTERN.split(push.content or "")
+        self.fields = tuple(sorted(set(self._parts[1::2])))
+        # MarkdownV2 下只转义用户资料中的动态内容，推送内容本身由管理员负责格式
+        self._escape = escape_markdown if self.parse_mode else None
+
+    @property
+    def is_media(self) -> bool:
+        return self.media_field is not None
+
+    def render(self, user=None) -> str:
+        """生成某个接收者的文本"""
+        if not self.fields:
+            return self._parts[0]
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            value = getattr(user, parts[i], None) or ""
+            parts[i] = self._escape(value) if self._escape else value
+        return "".join(parts)
+
+    def fallback_text(self, text: str) -> str:
+        """媒体无法发送时使用的文本"""
+        return f"[{self.media_label}] {text}\n{self.media_url}"
+
+
+def compile_push(push) -> CompiledPush:
+    """编译推送"""
+    compiled = CompiledPush(push)
+    logger.info(
+        f"推送 {push.push_id} 已编译: 发送方法 {compiled.send_method}, "
+        f"格式 {compiled.parse_mode}, 个性化字段 {list(compiled.fields)}"
+    )
+    return compiled
\ No newline at end of file
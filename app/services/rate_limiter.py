@@ -0,0 +1,265 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from app.bot.config import (
+    PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, PUSH_PER_CHAT_RATE, PUSH_MIN_RATE, PUSH_LATENCY_TARGET,
+    PUSH_PRIORITY_WEIGHTS
+)
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedClock:
+    """模拟时钟：供限流器离线估算发送耗时，需要等待时直接推进时间"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多累积 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """预留一个令牌，返回需要等待的秒数
+
+        令牌允许透支，后来的调用者按透支量排队等待，因此无需加锁且先到先得。
+        """
+        self._refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    def set_rate(self, rate: float):
+        """调整补充速率，已累积的令牌按原速率结算"""
+        self._refill()
+        self.rate = rate
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """获取一个令牌，必要时等待"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class PerChatLimiter:
+    """按聊天限流：同一聊天两次发送之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate: float, max_entries: int = 100000, clock=time.monotonic):
+        self.interval = 1.0 / rate
+        self.max_entries = max_entries
+        self._clock = clock
+        self._next_allowed = {}
+
+    def reserve(self, chat_id) -> float:
+        """预留该聊天的下一个发送时间，返回需要等待的秒数"""
+        now = self._clock()
+        start = max(now, self._next_allowed.get(chat_id, now))
+        self._next_allowed[chat_id] = start + self.interval
+        if len(self._next_allowed) > self.max_entries:
+            self._prune(now)
+        return start - now
+
+    def _prune(self, now: float):
+        """清理已经过期的聊天记录，避免字典无限增长"""
+        self._next_allowed = {
+            chat_id: allowed for chat_id, allowed in self._next_allowed.items() if allowed > now
+        }
+
+
+class _Lane:
+    """公平分配中的一个通道（一个推送）"""
+
+    __slots__ = ("weight", "priority", "finish", "waiters")
+
+    def __init__(self, weight: float, priority: str = None):
+        self.weight = weight
+        self.priority = priority
+        self.finish = 0.0  # 虚拟完成时间
+        self.waiters = deque()
+
+
+class FairShare:
+    """按权重在多个通道之间分配全局令牌（加权公平排队）
+
+    每个正在发送的推送是一个通道。取得令牌后分配给虚拟完成时间最小的通道中最早的等待者，
+    通道每获得一个令牌虚拟完成时间增加 1/weight，同时等待的通道因此按权重比例分享速率；
+    只有一个通道时等同于先到先得。空闲后恢复的通道从当前虚拟时间开始，不会积累配额。
+    令牌由唯一的分配协程依次获取，没有等待者时分配协程退出。
+    """
+
+    def __init__(self, bucket: TokenBucket, paused_until):
+        self.bucket = bucket
+        # 返回全局暂停截止时间的函数
+        self._paused_until = paused_until
+        self._lanes = {}
+        self._virtual = 0.0
+        self._waiting = 0
+        self._dispatcher = None
+
+    async def acquire(self, lane=None, weight: float = 1.0, priority: str = None):
+        """等待通道 lane 分到一个全局令牌"""
+        state = self._lanes.get(lane)
+        if state is None:
+            state = self._lanes[lane] = _Lane(weight, priority)
+        if not state.waiters:
+            state.finish = max(state.finish, self._virtual)
+        state.weight = weight
+
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        self._waiting += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def waiting_by_priority(self) -> dict:
+        """各优先级正在等待令牌的数量"""
+        totals = {}
+        for state in list(self._lanes.values()):
+            key = (state.priority or "default",)
+            totals[key] = totals.get(key, 0) + len(state.waiters)
+        return totals
+
+    async def _dispatch(self):
+        """依次获取全局令牌并分配给等待的通道"""
+        while self._waiting:
+            paused = self._paused_until() - time.monotonic()
+            if paused > 0:
+                await asyncio.sleep(paused)
+                continue
+            await self.bucket.acquire()
+            # 等待令牌期间可能触发了暂停，需要重新等待
+            if time.monotonic() < self._paused_until():
+                continue
+            self._grant()
+
+    def _grant(self):
+        """把一个令牌分配给虚拟完成时间最小的通道，跳过已取消的等待者"""
+        while self._waiting:
+            best = None
+            for key, state in list(self._lanes.items()):
+                if state.waiters:
+                    if best is None or state.finish < best.finish:
+                        best = state
+                elif state.finish <= self._virtual:
+                    # 空闲通道恢复时也从当前虚拟时间开始，无需保留
+                    del self._lanes[key]
+            future = best.waiters.popleft()
+            self._waiting -= 1
+            if future.done():
+                continue
+            self._virtual = best.finish
+            best.finish += 1.0 / best.weight
+            future.set_result(None)
+            return
+
+
+class RateLimiter:
+    """组合限流器：先满足单聊天限制，再占用全局令牌
+
+    全局速率在 [min_rate, max_rate] 之间自适应调整（加性增、乘性减）：
+    收到 RetryAfter 时暂停全局发送并把速率减半；平均延迟超过 latency_target 时小幅降速；
+    否则每个调整周期增加 max_rate 的 5%，直到恢复到上限。
+    同时发送的推送按优先级权重公平分享全局令牌（见 FairShare）。
+    """
+
+    ADJUST_INTERVAL = 1.0
+
+    def __init__(self, global_rate: float, global_burst: float, per_chat_rate: float,
+                 min_rate: float = None, latency_target: float = PUSH_LATENCY_TARGET):
+        self.max_rate = global_rate
+        self.min_rate = min(global_rate, min_rate or PUSH_MIN_RATE)
+        self.latency_target = latency_target
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.per_chat = PerChatLimiter(per_chat_rate)
+        self.fair_share = FairShare(self.global_bucket, lambda: self._paused_until)
+        self.latency = None  # 发送延迟的指数移动平均
+        self._paused_until = 0.0
+        self._last_adjust = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """当前全局速率"""
+        return self.global_bucket.rate
+
+    async def acquire(self, chat_id=None, lane=None, priority: str = None):
+        """在向 chat_id 发送前调用，lane 为发送所属的通道（推送ID），priority 决定通道的权重"""
+        if chat_id is not None:
+            wait = self.per_chat.reserve(chat_id)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        weight = PUSH_PRIORITY_WEIGHTS.get(priority or "normal", 1.0)
+        await self.fair_share.acquire(lane, weight, priority)
+
+    def pause(self, seconds: float):
+        """收到 RetryAfter 时暂停全局发送 seconds 秒，并降低速率"""
+        now = time.monotonic()
+        # 同一批并发请求会同时收到 429，暂停期间只降速一次
+        if now >= self._paused_until:
+            self._set_rate(self.rate * 0.5)
+            logger.warning(f"触发 Telegram 限流，暂停 {seconds:.1f} 秒，速率降至 {self.rate:.1f} 条/秒")
+        self._paused_until = max(self._paused_until, now + seconds)
+
+    def record_success(self, latency: float):
+        """记录一次成功发送的延迟，并按周期调整速率"""
+        self.latency = latency if self.latency is None else self.latency * 0.9 + latency * 0.1
+        now = time.monotonic()
+        if now - self._last_adjust < self.ADJUST_INTERVAL or now < self._paused_until:
+            return
+        if self.latency > self.latency_target:
+            self._set_rate(self.rate * 0.9)
+        elif self.rate < self.max_rate:
+            self._set_rate(self.rate + self.max_rate * 0.05)
+
+    def _set_rate(self, rate: float):
+        self.global_bucket.set_rate(min(self.max_rate, max(self.min_rate, rate)))
+        self._last_adjust = time.monotonic()
+
+
+_rate_limiters = {}
+
+
+def _waiting_by_priority():
+    totals = {}
+    for limiter in list(_rate_limiters.values()):
+        for key, count in limiter.fair_share.waiting_by_priority().items():
+            totals[key] = totals.get(key, 0) + count
+    return totals
+
+
+metrics.Gauge("rate_limiter_waiting", "等待全局发送配额的发送数", ["priority"], function=_waiting_by_priority)
+
+
+def get_rate_limiter(bot_index: int = 0) -> RateLimiter:
+    """获取进程内共享的限流器
+
+    Telegram 按 Bot 限制发送速率，Bot 池中每个 Bot 有独立的限流器，同一 Bot 的所有推送共用它的全局发送配额。
+    """
+    limiter = _rate_limiters.get(bot_index)
+    if limiter is None:
+        limiter = _rate_limiters[bot_index] = RateLimiter(PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, PUSH_PER_CHAT_RATE)
+        logger.info(
+            f"初始化 Bot {bot_index} 的限流器: 全局 {PUSH_GLOBAL_RATE} 条/秒, 单聊天 {PUSH_PER_CHAT_RATE} 条/秒"
+        )
+    return limiter
\ No newline at end of file
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import logging
+import uuid
+from datetime import datetime, timedelta
+from app.db.session import SessionLocal
+from app.crud import pushs as pushs_crud
+from app.crud import jobs as jobs_crud
+from app.bot.config import SCHEDULER_HORIZON
+
+logger = logging.getLogger(__name__)
+
+
+class PushScheduler:
+    """定时推送调度器
+
+    从 (status, scheduled_time) 索引加载未来 horizon 秒内到期的推送放入最小堆，
+    睡眠到最近的到期时间后派发为发送任务。推送创建或修改时调用 wake() 立即重新加载，
+    因此不需要每秒轮询数据库。
+    """
+
+    def __init__(self, horizon: float = SCHEDULER_HORIZON):
+        self.horizon = horizon
+        self._heap = []
+        self._wake = None
+        self._loop = None
+        self._stopping = False
+
+    def wake(self):
+        """通知调度器重新加载（可在线程池中的同步接口里调用）"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self):
+        """停止调度"""
+        self._stopping = True
+        self.wake()
+
+    async def run(self):
+        """调度主循环"""
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        logger.info("定时推送调度器已启动")
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                self._reload()
+                self._dispatch_due()
+            except Exception as e:
+                logger.error(f"调度定时推送出错: {e}")
+
+            timeout = self.horizon
+            if self._heap:
+                timeout = min(timeout, max(0.0, (self._heap[0][0] - datetime.now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reload(self):
+        """重新加载 horizon 内到期的推送"""
+        db = SessionLocal()
+        try:
+            before = datetime.now() + timedelta(seconds=self.horizon)
+            self._heap = [(row.scheduled_time, row.push_id) for row in pushs_crud.get_due_pushes(db, before)]
+            heapq.heapify(self._heap)
+        finally:
+            db.close()
+
+    def _dispatch_due(self):
+        """派发已经到期的推送"""
+        now = datetime.now()
+        if not self._heap or self._heap[0][0] > now:
+            return
+        db = SessionLocal()
+        try:
+            while self._heap and self._heap[0][0] <= now:
+                scheduled_time, push_id = heapq.heappop(self._heap)
+                # 推送可能已被取消、修改或由其他进程派发，只有领取成功才发送
+                token = uuid.uuid4().hex
+                if not pushs_crud.claim_scheduled_push(db, push_id, token):
+                    continue
+                try:
+                    job = jobs_crud.enqueue_job(db, push_id, kind="send", token=token)
+                    logger.info(f"定时推送 {push_id} 已到期（{scheduled_time}），任务ID: {job.job_id}")
+                except Exception as e:
+                    logger.error(f"派发定时推送 {push_id} 失败: {e}")
+                    pushs_crud.release_push(db, push_id, token, "scheduled")
+        finally:
+            db.close()
+
+
+scheduler = PushScheduler()
+
+
+def notify_scheduler():
+    """推送的定时信息发生变化时调用"""
+    scheduler.wake()
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""推送任务 worker
+
+从 push_jobs 表领取任务并执行，可独立于 API 进程运行和扩容：
+
+    python -m app.worker
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from dotenv import load_dotenv
+from sqlalchemy.exc import OperationalError
+from app.db.session import SessionLocal
+from app.crud import jobs as jobs_crud
+from app.crud import pushs as pushs_crud
+from app.crud import partitions as partitions_crud
+from app.bot.config import PARTITION_LEASE_SECONDS, PUSH_PRIORITIES
+from app.bot.client import init_bot, shutdown_bot
+from app.services.errors import is_transient
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 没有任务时的轮询间隔（秒）
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1"))
+# 心跳间隔（秒）
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "10"))
+# 超过该时间（秒）没有心跳的任务视为 worker 已崩溃，可被其他 worker 接管
+WORKER_STALE_AFTER = int(os.getenv("WORKER_STALE_AFTER", "60"))
+# 单个任务最多执行次数
+WORKER_MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "5"))
+# 单个 worker 同时执行的任务数
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "4"))
+# 名额被占满后额外为紧急推送保留的名额，长时间的大推送不会让紧急推送排队
+WORKER_URGENT_JOBS = int(os.getenv("WORKER_URGENT_JOBS", "1"))
+# 独立运行时导出 Prometheus 指标的端口，0 表示不导出
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+
+async def _run_send(push_id: int, token: str = None):
+    from app.services.push_service import send_push
+    await send_push(push_id, token)
+
+
+async def _run_delete(push_id: int, token: str = None):
+    from app.services.push_service import delete_sent_message
+    result = await delete_sent_message(push_id)
+    if not result.get("success"):
+        raise RuntimeError(result.get("error"))
+
+
+# 任务类型 -> 处理函数
+JOB_HANDLERS = {
+    "send": _run_send,
+    "delete": _run_delete,
+}
+
+
+class PushWorker:
+    """领取并执行推送任务和推送分区，运行期间定时发送心跳/续约"""
+
+    def __init__(self, worker_id: str = None, max_jobs: int = WORKER_MAX_JOBS, urgent_jobs: int = WORKER_URGENT_JOBS):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.max_jobs = max(1, max_jobs)
+        self.urgent_jobs = max(0, urgent_jobs)
+        self._running = {}
+        self._stopping = False
+
+    async def run(self):
+        """主循环：有空闲名额时领取任务，没有任务时等待
+
+        普通名额占满后只领取最高优先级（紧急）推送的任务和分区，直到保留名额也占满。
+        """
+        logger.info(f"Worker {self.worker_id} 已启动")
+        db = SessionLocal()
+        try:
+            while not self._stopping:
+                if len(self._running) >= self.max_jobs + self.urgent_jobs:
+                    await asyncio.sleep(WORKER_POLL_INTERVAL)
+                    continue
+                priorities = PUSH_PRIORITIES[:1] if len(self._running) >= self.max_jobs else None
+
+                try:
+                    self._fail_exhausted(db)
+                    # 优先领取任务，没有任务时领取大推送的分区
+                    job = jobs_crud.claim_job(db, self.worker_id, WORKER_STALE_AFTER, WORKER_MAX_ATTEMPTS,
+                                              priorities)
+                    partition = None
+                    if job is None:
+                        partition = partitions_crud.claim_partition(
+                            db, self.worker_id, PARTITION_LEASE_SECONDS, WORKER_MAX_ATTEMPTS, priorities
+                        )
+                except Exception as e:
+                    logger.error(f"Worker 领取任务出错: {e}")
+                    job = partition = None
+
+                if job is not None:
+                    logger.info(f"Worker {self.worker_id} 领取任务 {job.job_id}（{job.kind}，推送 {job.push_id}，第 {job.attempts} 次）")
+                    self._start(f"job:{job.job_id}", self._run_job(job.job_id, job.kind, job.push_id, job.token))
+                elif partition is not None:
+                    logger.info(
+                        f"Worker {self.worker_id} 领取推送 {partition.push_id} 的分区 {partition.partition_no}"
+                        f"（第 {partition.attempts} 次）"
+                    )
+                    self._start(
+                        f"partition:{partition.partition_id}",
+                        self._run_partition(partition.partition_id, partition.push_id,
+                                            partition.lo_user_id, partition.hi_user_id, partition.attempts)
+                    )
+                else:
+                    await asyncio.sleep(WORKER_POLL_INTERVAL)
+        finally:
+            await self.shutdown()
+            db.close()
+
+    def _start(self, key: str, coro):
+        """在后台执行任务，结束后释放名额"""
+        task = asyncio.create_task(coro)
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+
+    def _fail_exhausted(self, db):
+        """清理重试次数用尽的任务和分区"""
+        for push_id, kind, token in jobs_crud.fail_exhausted_jobs(db, WORKER_STALE_AFTER, WORKER_MAX_ATTEMPTS):
+            self._release_failed_send(db, push_id, kind, token)
+        for push_id in partitions_crud.fail_exhausted_partitions(db, WORKER_MAX_ATTEMPTS):
+            self._complete_partitioned_push(db, push_id)
+
+    def stop(self):
+        """停止领取新任务，并中断正在执行的任务（任务会释放回队列）"""
+        self._stopping = True
+        for task in list(self._running.values()):
+            task.cancel()
+
+    async def shutdown(self):
+        """等待正在执行的任务结束"""
+        self.stop()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def _run_job(self, job_id: int, kind: str, push_id: int, token: str = None):
+        """执行单个任务并维护心跳"""
+        handler = JOB_HANDLERS.get(kind)
+        db = SessionLocal()
+        try:
+            if handler is None:
+                logger.error(f"未知的任务类型: {kind}")
+                jobs_crud.finish_job(db, job_id, self.worker_id, "failed", f"未知的任务类型: {kind}")
+                return
+
+            job_task = asyncio.create_task(handler(push_id, token))
+            heartbeat = asyncio.create_task(self._heartbeat(db, job_id, job_task))
+            try:
+                await job_task
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+            jobs_crud.finish_job(db, job_id, self.worker_id, "done")
+            logger.info(f"任务 {job_id} 执行完成")
+        except asyncio.CancelledError:
+            # worker 退出：释放任务，由其他 worker 继续执行
+            logger.warning(f"任务 {job_id} 被中断，释放回队列")
+            jobs_crud.finish_job(db, job_id, self.worker_id, "pending")
+            raise
+        except Exception as e:
+            logger.error(f"任务 {job_id} 执行失败: {e}")
+            jobs_crud.finish_job(db, job_id, self.worker_id, "failed", str(e))
+            self._release_failed_send(db, push_id, kind, token)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _release_failed_send(db, push_id: int, kind: str, token: str = None):
+        """发送任务最终失败时把仍由该任务持有的推送改为已取消，之后可以重新发送"""
+        if kind != "send":
+            return
+        try:
+            if pushs_crud.release_push(db, push_id, token, "cancelled"):
+                logger.warning(f"推送 {push_id} 的发送任务失败，已改为已取消")
+        except Exception as e:
+            logger.error(f"释放推送 {push_id} 失败: {e}")
+
+    @staticmethod
+    def _complete_partitioned_push(db, push_id: int):
+        """所有分区结束后结束推送，有分区失败时推送改为已取消"""
+        status = partitions_crud.complete_push_if_partitions_done(db, push_id)
+        if status == "completed":
+            logger.info(f"推送 {push_id} 的所有分区已完成")
+        elif status == "cancelled":
+            logger.warning(f"推送 {push_id} 有分区发送失败，已改为已取消，可以重新发送")
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """分区发送的异常是否可以重试：数据库连接中断、锁等待超时以及 Telegram 网络错误"""
+        return isinstance(error, OperationalError) or is_transient(error)
+
+    async def _run_partition(self, partition_id: int, push_id: int, lo_user_id: int, hi_user_id: int,
+                             attempts: int = 1):
+        """发送一个推送分区，定时续约并上报进度
+
+        可重试的异常在重试次数用尽前把分区释放回队列，其他异常直接标记分区失败。
+        """
+        from app.services.push_service import send_partition
+
+        db = SessionLocal()
+        progress = {"sent": 0, "failed": 0}
+        reported = {"sent": 0, "failed": 0}
+        try:
+            partition_task = asyncio.create_task(send_partition(push_id, lo_user_id, hi_user_id, progress))
+            renew = asyncio.create_task(self._renew_partition(db, partition_id, partition_task, progress, reported))
+            try:
+                await partition_task
+            finally:
+                renew.cancel()
+                await asyncio.gather(renew, return_exceptions=True)
+            sent, failed = self._unreported(progress, reported)
+            partitions_crud.finish_partition(db, partition_id, self.worker_id, "done", sent, failed)
+            self._complete_partitioned_push(db, push_id)
+        except asyncio.CancelledError:
+            # worker 退出或租约被接管：释放分区，由其他 worker 继续（已发送的用户会被跳过）
+            logger.warning(f"推送 {push_id} 的分区 {partition_id} 被中断，释放租约")
+            sent, failed = self._unreported(progress, reported)
+            partitions_crud.finish_partition(db, partition_id, self.worker_id, "pending", sent, failed)
+            raise
+        except Exception as e:
+            sent, failed = self._unreported(progress, reported)
+            if self._is_retryable(e) and attempts < WORKER_MAX_ATTEMPTS:
+                logger.warning(f"推送 {push_id} 的分区 {partition_id} 发送出错，释放回队列重试: {e}")
+                partitions_crud.finish_partition(db, partition_id, self.worker_id, "pending", sent, failed, str(e),
+                                                 retry=True)
+                return
+            logger.error(f"推送 {push_id} 的分区 {partition_id} 发送失败: {e}")
+            partitions_crud.finish_partition(db, partition_id, self.worker_id, "failed", sent, failed, str(e))
+            self._complete_partitioned_push(db, push_id)
+        finally:
+            db.close()
+
+    async def _renew_partition(self, db, partition_id: int, partition_task: asyncio.Task,
+                               progress: dict, reported: dict):
+        """定时续约分区租约并上报进度；租约被接管时中断本地发送"""
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            sent, failed = self._unreported(progress, reported)
+            if not partitions_crud.renew_partition(db, partition_id, self.worker_id, PARTITION_LEASE_SECONDS,
+                                                   sent, failed):
+                logger.warning(f"分区 {partition_id} 的租约已被其他 worker 接管，停止发送")
+                partition_task.cancel()
+                return
+
+    @staticmethod
+    def _unreported(progress: dict, reported: dict):
+        """返回自上次上报以来新增的成功/失败数量"""
+        sent = progress["sent"] - reported["sent"]
+        failed = progress["failed"] - reported["failed"]
+        reported.update(progress)
+        return sent, failed
+
+    async def _heartbeat(self, db, job_id: int, job_task: asyncio.Task):
+        """定时心跳；发现任务已被其他 worker 接管时中断本地执行"""
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            if not jobs_crud.heartbeat_job(db, job_id, self.worker_id):
+                logger.warning(f"任务 {job_id} 已被其他 worker 接管，停止执行")
+                job_task.cancel()
+                return
+
+
+async def main():
+    """独立运行 worker，收到 SIGINT/SIGTERM 后释放任务并退出"""
+    worker = PushWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            # Windows 不支持 add_signal_handler
+            pass
+    metrics_server = None
+    if WORKER_METRICS_PORT:
+        from app.core.metrics import serve_metrics
+        metrics_server = await serve_metrics(WORKER_METRICS_PORT)
+    await init_bot()
+    try:
+        await worker.run()
+    finally:
+        await shutdown_bot()
+        if metrics_server is not None:
+            metrics_server.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from app.db.models import Base
+    from app.db.session import engine
+
+    # 创建数据库表
+    Base.metadata.create_all(bind=engine)
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""推送发送性能测试
+
+在本地 SQLite（或指定的数据库）中创建 N 个用户和一条推送，启动模拟的 Bot API 服务器，
+调用 send_push 完整执行一次发送，输出吞吐量、单条发送延迟、每条消息的数据库查询数和内存峰值：
+
+    python -m benchmarks.bench_push --users 10000 --latency 50 --rate 1000
+
+全程离线运行，不会访问 Telegram。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="推送发送性能测试")
+    parser.add_argument("--users", type=int, default=10000, help="用户数量")
+    parser.add_argument("--content-type", default="text", choices=["text", "photo"], help="推送类型")
+    parser.add_argument("--personalized", action="store_true", help="内容中使用 {first_name} 个性化字段")
+    parser.add_argument("--audience", default="explicit", choices=["explicit", "all_active"], help="受众类型")
+    parser.add_argument("--bots", type=int, default=1, help="Bot 池中的 Bot 数量，用户轮流分配给各个 Bot")
+    parser.add_argument("--rate", type=float, default=1000, help="每个 Bot 的全局发送速率 PUSH_GLOBAL_RATE（条/秒）")
+    parser.add_argument("--concurrency", type=int, default=100, help="发送并发数 PUSH_CONCURRENCY")
+    parser.add_argument("--latency", type=float, default=50, help="模拟服务器平均响应延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务器返回 403 的比例")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="模拟服务器返回 429 的比例")
+    parser.add_argument("--port", type=int, default=8081, help="模拟服务器端口")
+    parser.add_argument("--external-server", action="store_true",
+                        help="连接已单独启动的模拟服务器，避免与被测进程争用 CPU")
+    parser.add_argument("--database-url", help="数据库地址，默认使用临时 SQLite 文件")
+    parser.add_argument("--reset", action="store_true", help="清空并重建 --database-url 中的表")
+    parser.add_argument("--delete", action="store_true", help="发送后再测试撤回消息")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    return parser.parse_args()
+
+
+def configure(args):
+    """在导入 app 之前设置环境变量，配置在导入时读取"""
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), "telegram_bot_bench.db")
+        if os.path.exists(path):
+            os.remove(path)
+        database_url = f"sqlite:///{path}"
+    elif not args.reset:
+        sys.exit("使用 --database-url 时需要同时指定 --reset（会清空该数据库中的表）")
+
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "TELEGRAM_BOT_TOKEN": "123456:BENCHMARK",
+        "TELEGRAM_EXTRA_BOT_TOKENS": ",".join(f"{123457 + i}:BENCHMARK" for i in range(args.bots - 1)),
+        "TELEGRAM_API_BASE_URL": f"http://127.0.0.1:{args.port}/bot",
+        "HTTP_PROXY": "",
+        "PUSH_GLOBAL_RATE": str(args.rate),
+        "PUSH_GLOBAL_BURST": str(max(1, args.concurrency)),
+        "PUSH_MIN_RATE": str(args.rate),
+        "PUSH_CONCURRENCY": str(args.concurrency),
+        # 单进程测试完整的发送路径，不切分区
+        "PUSH_PARTITION_SIZE": str(args.users + 1),
+    })
+
+
+def seed(args):
+    """重建表并写入测试用户和推送，返回推送ID"""
+    from app.db.session import engine, SessionLocal
+    from app.db.models import Base, User
+    from app.crud import pushs as pushs_crud
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        batch = 10000
+        for start in range(0, args.users, batch):
+            db.execute(User.__table__.insert(), [
+                {
+                    "telegram_id": 1000000000 + i,
+                    "username": f"user{i}",
+                    "first_name": f"Bench{i}",
+                    "is_active": True,
+                    "bot_index": i % args.bots,
+                }
+                for i in range(start, min(start + batch, args.users))
+            ])
+        db.commit()
+
+        push_data = {
+            "title": "Benchmark",
+            "content": "你好，{first_name}！这是一条性能测试消息。" if args.personalized else "这是一条性能测试消息。",
+            "content_type": args.content_type,
+            "media_url": "https://example.com/benchmark.jpg" if args.content_type == "photo" else None,
+            "status": "sending",
+            "buttons": json.dumps([{"text": "访问网站", "url": "https://example.com"}]),
+        }
+        if args.audience == "explicit":
+            push_data["target_user_ids"] = list(range(1, args.users + 1))
+        else:
+            push_data["audience"] = {"type": args.audience}
+        return pushs_crud.create_push(db, push_data).push_id
+    finally:
+        db.close()
+
+
+class QueryCounter:
+    """统计数据库往返次数（executemany 计为一次）"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+class LatencySamples:
+    """所有 Bot 的限流器共同记录的发送延迟"""
+
+    def __init__(self):
+        self.samples = []
+
+
+def install_latency_recorder(bots: int):
+    """替换进程内每个 Bot 的限流器，记录扇出引擎上报的每次成功发送的延迟"""
+    from app.services import rate_limiter
+    from app.bot.config import PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, PUSH_PER_CHAT_RATE
+
+    recorder = LatencySamples()
+
+    class RecordingRateLimiter(rate_limiter.RateLimiter):
+        def record_success(self, latency: float):
+            recorder.samples.append(latency)
+            super().record_success(latency)
+
+    for index in range(bots):
+        rate_limiter._rate_limiters[index] = RecordingRateLimiter(
+            PUSH_GLOBAL_RATE, PUSH_GLOBAL_BURST, PUSH_PER_CHAT_RATE
+        )
+    return recorder
+
+
+def percentile(samples, p: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run_phase(name, coro, limiter, queries):
+    """执行一个阶段并返回统计结果"""
+    limiter.samples.clear()
+    queries_before = queries.count
+    started = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - started
+    samples = limiter.samples
+    return {
+        "phase": name,
+        "seconds": round(elapsed, 3),
+        "succeeded": len(samples),
+        "msgs_per_sec": round(len(samples) / elapsed, 1) if elapsed else None,
+        "latency_p50_ms": round(percentile(samples, 0.5) * 1000, 1) if samples else None,
+        "latency_p99_ms": round(percentile(samples, 0.99) * 1000, 1) if samples else None,
+        "latency_mean_ms": round(statistics.mean(samples) * 1000, 1) if samples else None,
+        "db_queries": queries.count - queries_before,
+        "db_queries_per_msg": round((queries.count - queries_before) / len(samples), 3) if samples else None,
+    }
+
+
+async def benchmark(args, push_id):
+    from app.db.session import engine, SessionLocal
+    from app.crud import pushs as pushs_crud
+    from app.bot.client import init_bot, shutdown_bot
+    from app.services.push_service import send_push, delete_sent_message
+
+    # 每个请求一条的 httpx 日志会明显拖慢发送，测试时关闭
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    limiter = install_latency_recorder(args.bots)
+    queries = QueryCounter(engine)
+    await init_bot()
+    try:
+        results = [await run_phase("send", send_push(push_id), limiter, queries)]
+        if args.delete:
+            results.append(await run_phase("delete", delete_sent_message(push_id), limiter, queries))
+    finally:
+        await shutdown_bot()
+
+    db = SessionLocal()
+    try:
+        push = pushs_crud.get_push(db, push_id)
+        results[0].update({"status": push.status, "sent_count": push.sent_count, "failed_count": push.failed_count})
+    finally:
+        db.close()
+    return results
+
+
+def main():
+    args = parse_args()
+    configure(args)
+
+    from benchmarks.fake_bot_api import FakeBotAPI, FakeBotAPIServer
+
+    seed_started = time.perf_counter()
+    push_id = seed(args)
+    seed_seconds = time.perf_counter() - seed_started
+
+    api = FakeBotAPI(args.latency / 1000, args.error_rate, args.retry_after_rate)
+    if args.external_server:
+        results = asyncio.run(benchmark(args, push_id))
+    else:
+        with FakeBotAPIServer(api, port=args.port):
+            results = asyncio.run(benchmark(args, push_id))
+
+    report = {
+        "users": args.users,
+        "content_type": args.content_type,
+        "audience": args.audience,
+        "bots": args.bots,
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "server_latency_ms": args.latency,
+        "seed_seconds": round(seed_seconds, 2),
+        "phases": results,
+        # 使用外部服务器时没有服务器端统计
+        "server_calls": dict(api.calls),
+        "server_calls_by_token": dict(api.calls_by_token),
+        "server_responses": {str(code): count for code, count in api.responses.items()},
+        # Linux 下 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"用户数: {args.users}  类型: {args.content_type}  受众: {args.audience}  Bot 数: {args.bots}  "
+          f"每个 Bot 速率上限: {args.rate} 条/秒  并发: {args.concurrency}  模拟延迟: {args.latency} ms")
+    for phase in results:
+        print(f"[{phase['phase']}] {phase['succeeded']} 条 / {phase['seconds']} 秒 = {phase['msgs_per_sec']} 条/秒  "
+              f"p50 {phase['latency_p50_ms']} ms  p99 {phase['latency_p99_ms']} ms  "
+              f"数据库查询 {phase['db_queries']} 次（{phase['db_queries_per_msg']} 次/条）")
+    print(f"服务器调用: {report['server_calls']}  响应: {report['server_responses']}")
+    print(f"内存峰值: {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
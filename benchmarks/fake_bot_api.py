@@ -0,0 +1,148 @@
+"""模拟的 Telegram Bot API 服务器
+
+实现 getMe、sendMessage、sendPhoto/sendVideo/sendDocument/sendAudio、deleteMessage 和 setWebhook/deleteWebhook，
+可配置响应延迟、错误率和 429 限流注入，供性能测试离线使用：
+
+    python -m benchmarks.fake_bot_api --port 8081 --latency 50 --error-rate 0.01 --retry-after-rate 0.001
+
+然后设置 TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot 启动 API 或 worker。
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+MEDIA_METHODS = {
+    "sendPhoto": "photo",
+    "sendVideo": "video",
+    "sendDocument": "document",
+    "sendAudio": "audio",
+}
+
+
+class FakeBotAPI:
+    """模拟服务器的配置和统计
+
+    latency 为平均响应延迟（秒），实际延迟在 [0.5, 1.5] 倍之间随机；
+    error_rate 为返回 403（用户屏蔽）的比例，retry_after_rate 为返回 429 的比例。
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, retry_after_rate: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.calls_by_token = Counter()
+        self.webhooks = []
+        self.responses = Counter()
+        self._message_ids = itertools.count(1)
+        self.app = self._build_app()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/bot{token}/{method}")
+        async def handle(token: str, method: str, request: Request):
+            self.calls_by_token[token.split(":")[0]] += 1
+            return await self.handle(method, request)
+
+        return app
+
+    async def handle(self, method: str, request: Request):
+        self.calls[method] += 1
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"})
+        if method in ("setWebhook", "deleteWebhook"):
+            self.webhooks.append(dict(await request.form()))
+            return self._ok(True)
+
+        params = dict(await request.form())
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        if random.random() < self.retry_after_rate:
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               {"retry_after": self.retry_after})
+        if random.random() < self.error_rate:
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        if method == "deleteMessage":
+            return self._ok(True)
+        if method == "sendMessage" or method in MEDIA_METHODS:
+            return self._ok(self._message(method, params))
+        return self._error(404, "Not Found: method not found")
+
+    def _message(self, method: str, params: dict) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        }
+        field = MEDIA_METHODS.get(method)
+        if field == "photo":
+            message["photo"] = [{"file_id": "bench-photo", "file_unique_id": "bench-photo", "width": 1, "height": 1}]
+        elif field:
+            message[field] = {"file_id": f"bench-{field}", "file_unique_id": f"bench-{field}"}
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        else:
+            message["text"] = params.get("text", "")
+        return message
+
+    def _ok(self, result):
+        self.responses[200] += 1
+        return {"ok": True, "result": result}
+
+    def _error(self, code: int, description: str, parameters: dict = None):
+        self.responses[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return JSONResponse(body, status_code=code)
+
+
+class FakeBotAPIServer:
+    """在后台线程中运行模拟服务器，避免与被测的发送协程共用事件循环"""
+
+    def __init__(self, api: FakeBotAPI, host: str = "127.0.0.1", port: int = 8081):
+        import uvicorn
+        self.api = api
+        self.base_url = f"http://{host}:{port}/bot"
+        self._server = uvicorn.Server(uvicorn.Config(api.app, host=host, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 Telegram Bot API 服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=50, help="平均响应延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 403 的比例")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应中的 retry_after（秒）")
+    args = parser.parse_args()
+
+    import uvicorn
+    api = FakeBotAPI(args.latency / 1000, args.error_rate, args.retry_after_rate, args.retry_after)
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -13,6 +13,7 @@ const CreatePush = () => {
   const [messageType, setMessageType] = useState('text');
   const [formatType, setFormatType] = useState('plain');
   const [timingOption, setTimingOption] = useState('now');
+  const [audienceType, setAudienceType] = useState('explicit');
   const [loading, setLoading] = useState(false);
   const [users, setUsers] = useState([]);
   const [loadingUsers, setLoadingUsers] = useState(false);
@@ -43,7 +44,7 @@ const CreatePush = () => {
   };
 
   const handleSubmit = async (values) => {
-    if (selectedUsers.length === 0) {
+    if (audienceType === 'explicit' && selectedUsers.length === 0) {
       message.error('请选择至少一个接收用户');
       return;
     }
@@ -58,10 +59,25 @@ const CreatePush = () => {
         content: values.content,
         content_type: messageType,
         media_url: values.media_url || null,
-        target_user_ids: selectedUsers,
-        use_markdown: formatType === 'markdown'
+        use_markdown: formatType === 'markdown',
+        priority: values.priority || 'normal'
       };
   
+      // 受众：指定用户时传用户ID列表，其他受众由服务端在发送时解析
+      if (audienceType === 'explicit') {
+        pushData.target_user_ids = selectedUsers;
+      } else {
+        pushData.audience = { type: audienceType };
+        if (audienceType === 'active_since') {
+          pushData.audience.since = values.audience_since.format('YYYY-MM-DD[T]HH:mm:ss');
+        }
+      }
+  
+      // 定时发送：服务端按本地时间比较，发送不带时区的 ISO 时间
+      if (timingOption === 'scheduled' && values.scheduled_time) {
+        pushData.scheduled_time = values.scheduled_time.format('YYYY-MM-DD[T]HH:mm:ss');
+      }
+  
       // 处理按钮数据 - 关键修改：确保按钮数据是字符串
       if (buttons && buttons.length > 0) {
         // 过滤有效按钮
@@ -340,6 +356,18 @@ _斜体文本_ 使用 _下划线_
             </Radio.Group>
           </Form.Item>
           
+          <Form.Item
+            name="priority"
+            label="优先级"
+            initialValue="normal"
+          >
+            <Radio.Group>
+              <Radio.Button value="urgent">紧急</Radio.Button>
+              <Radio.Button value="normal">普通</Radio.Button>
+              <Radio.Button value="bulk">批量</Radio.Button>
+            </Radio.Group>
+          </Form.Item>
+          
           {timingOption === 'scheduled' && (
             <Form.Item
               name="scheduled_time"
@@ -351,26 +379,46 @@ _斜体文本_ 使用 _下划线_
           )}
           
           <Divider orientation="left">接收用户</Divider>
-          <Form.Item label="选择接收用户">
-            <div style={{ marginBottom: 16 }}>
-              <Space>
-                <Button onClick={() => setSelectedUsers(users.map(u => u.user_id))}>全选</Button>
-                <Button onClick={() => setSelectedUsers([])}>清除</Button>
-                <span>已选择 {selectedUsers.length} 个用户</span>
-              </Space>
-            </div>
-            
-            <Table
-              rowSelection={rowSelection}
-              columns={columns}
-              dataSource={users}
-              rowKey="user_id"
-              loading={loadingUsers}
-              size="small"
-              pagination={{ pageSize: 5 }}
-            />
+          <Form.Item label="受众">
+            <Radio.Group onChange={(e) => setAudienceType(e.target.value)} value={audienceType}>
+              <Radio value="explicit">指定用户</Radio>
+              <Radio value="all_active">全部活跃用户</Radio>
+              <Radio value="active_since">指定时间后活跃的用户</Radio>
+            </Radio.Group>
           </Form.Item>
           
+          {audienceType === 'active_since' && (
+            <Form.Item
+              name="audience_since"
+              label="最后交互晚于"
+              rules={[{ required: true, message: '请选择时间' }]}
+            >
+              <DatePicker showTime format="YYYY-MM-DD HH:mm:ss" />
+            </Form.Item>
+          )}
+          
+          {audienceType === 'explicit' && (
+            <Form.Item label="选择接收用户">
+              <div style={{ marginBottom: 16 }}>
+                <Space>
+                  <Button onClick={() => setSelectedUsers(users.map(u => u.user_id))}>全选</Button>
+                  <Button onClick={() => setSelectedUsers([])}>清除</Button>
+                  <span>已选择 {selectedUsers.length} 个用户</span>
+                </Space>
+              </div>
+              
+              <Table
+                rowSelection={rowSelection}
+                columns={columns}
+                dataSource={users}
+                rowKey="user_id"
+                loading={loadingUsers}
+                size="small"
+                pagination={{ pageSize: 5 }}
+              />
+            </Form.Item>
+          )}
+          
           <Form.Item>
             <Button type="primary" htmlType="submit" loading={loading}>
               创建推送
@@ -163,6 +163,17 @@ const PushesList = () => {
       title: '目标用户数',
       key: 'target_users',
       render: (_, record) => {
+        // 按受众发送的推送在发送时才解析接收者，显示受众类型
+        const audience = record.audience;
+        if (audience && audience.type === 'all_active') {
+          return <Tag>全部活跃用户</Tag>;
+        }
+        if (audience && audience.type === 'active_since') {
+          return <Tag>{moment(audience.since).format('YYYY-MM-DD HH:mm')} 后活跃的用户</Tag>;
+        }
+        if (record.target_user_count !== null && record.target_user_count !== undefined) {
+          return record.target_user_count;
+        }
         const targetUserIds = Array.isArray(record.target_user_ids)
           ? record.target_user_ids
           : JSON.parse(record.target_user_ids || '[]');
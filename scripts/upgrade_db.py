@@ -0,0 +1,72 @@
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 加载环境变量
+load_dotenv()
+
+from app.db.models import Base
+from app.db.session import engine
+
+
+def plan_upgrade(conn):
+    """对比模型与数据库，返回需要执行的 (说明, 操作) 列表
+
+    create_all 只创建不存在的表，不会修改已有的表；这里为已有的表补充缺少的列和索引。
+    先建表、再加列、最后建索引，新索引可能用到新加的列。
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    missing_tables = [table for table in Base.metadata.sorted_tables if table.name not in existing_tables]
+
+    steps = []
+    if missing_tables:
+        names = ", ".join(table.name for table in missing_tables)
+        steps.append((f"创建表 {names}", lambda: Base.metadata.create_all(conn, tables=missing_tables)))
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                sql = f"ALTER TABLE {table.name} ADD COLUMN {ddl}"
+                steps.append((sql, lambda sql=sql: conn.execute(text(sql))))
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                steps.append((f"创建索引 {table.name}.{index.name}", lambda index=index: index.create(conn)))
+    return steps
+
+
+def upgrade(dry_run: bool = False):
+    with engine.begin() as conn:
+        steps = plan_upgrade(conn)
+        if not steps:
+            print("数据库结构已是最新")
+            return
+        for description, action in steps:
+            print(description)
+            if not dry_run:
+                action()
+    print("仅列出需要执行的变更，未修改数据库" if dry_run else "数据库升级完成")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为已有数据库补充新版本需要的表、列和索引")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要执行的变更")
+
+    args = parser.parse_args()
+
+    upgrade(args.dry_run)
\ No newline at end of file